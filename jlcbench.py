@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+#############################################################################
+##
+## Copyright (C) 2021 Joe Skaife.
+## All rights reserved.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+## "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+## LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+## A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+## OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+## SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+## LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+## DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+## THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+## (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+## OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+#############################################################################
+
+import csv
+import os
+import sys
+import json
+import sqlite3
+import time
+import random
+import shutil
+import tempfile
+import platform
+import argparse
+import multiprocessing
+
+from jlccore import *
+
+# Times the slow parts of jlcqt against a made up catalogue and BOM so changes can be compared, eg:
+#   python jlcbench.py --rows 100000 --out before.json
+#   python jlcbench.py --rows 100000 --compare before.json
+
+
+# What the made up catalogue is made of, roughly in the proportions JLC has them
+capacitorValues = ['1pF', '10pF', '22pF', '100pF', '1nF', '4.7nF', '10nF', '22nF', '100nF', '220nF', '470nF',
+                   '1μF', '2.2μF', '4.7μF', '10μF', '22μF', '47μF', '100μF']
+resistorValues = ['0Ω', '10Ω', '22Ω', '47Ω', '100Ω', '220Ω', '330Ω', '470Ω', '1kΩ',
+                  '2.2kΩ', '4.7kΩ', '10kΩ', '22kΩ', '47kΩ', '100kΩ', '1MΩ']
+inductorValues = ['1μH', '2.2μH', '4.7μH', '10μH', '22μH', '47μH', '100μH']
+chipPackages = ['0201', '0402', '0402', '0402', '0603', '0603', '0603', '0805', '0805', '1206', '1210']
+icPackages = ['SOIC-8_150mil', 'SOT-23-3', 'SOT-23-5', 'SOT-23-6', 'TSSOP-20_4.4x6.5x0.65P', 'QFN-32_5x5x05P',
+              'LQFP-48_7x7x05P', 'LQFP-64_10x10x05P', 'DIP-8', 'SOP-16_150mil']
+diodePackages = ['SOD-123', 'SOD-323', 'SMA(DO-214AC)', 'SMB(DO-214AA)', 'SOT-23-3']
+manufacturers = ['Samsung Electro-Mechanics', 'YAGEO', 'UNI-ROYAL(Uniroyal Elec)', 'muRata', 'TDK', 'FH(Guangdong Fenghua Advanced Tech)',
+                 'Texas Instruments', 'STMicroelectronics', 'ON Semiconductor', 'Nexperia', 'Diodes Incorporated', 'Sunlord']
+icFunctions = [('Embedded Processors & Controllers', 'Microcontroller Units (MCUs/MPUs/SOCs)', 'Microcontroller 32bit'),
+               ('Power Management ICs', 'Linear Voltage Regulators (LDO)', 'LDO Regulator 3.3V 300mA'),
+               ('Amplifiers', 'Operational Amplifier', 'Dual Op Amp Rail-to-Rail'),
+               ('Interface ICs', 'USB Converters', 'USB to UART Converter'),
+               ('Logic ICs', 'Gates', 'Single 2-Input NAND Gate')]
+
+# Keywords and packages searched for, a mix of small and big results and of value and text matches
+benchSearches = [(['cap', '100nf'], []),
+                 (['cap', '100nf'], ['0402']),
+                 (['res', '10k', '1%'], ['0603']),
+                 (['res'], []),
+                 (['microcontroller'], ['LQFP-48_7x7x05P']),
+                 (['regulator'], []),
+                 (['sod-123'], [])]
+benchPageSize = 100               # Rows shown when a search first comes up, the same as PartTableModel.fetchSize
+
+
+def randomPriceString(rng):
+    # JLC's "1-9:0.05,10-99:0.04,100-:0.03", cheaper for bigger quantities, sometimes with a minimum order
+    breaks = rng.choice([1, 2, 3, 4, 5, 6])
+    quantity = rng.choice([1, 1, 1, 5, 10, 20, 50, 100])
+    unitPrice = round(10**rng.uniform(-4, 1), 4)
+    prices = []
+    for breakIndex in range(breaks):
+        nextQuantity = quantity*rng.choice([5, 10])
+        if breakIndex == breaks - 1:
+            prices.append('{0}-:{1}'.format(quantity, unitPrice))
+        else:
+            prices.append('{0}-{1}:{2}'.format(quantity, nextQuantity - 1, unitPrice))
+        quantity = nextQuantity
+        unitPrice = max(round(unitPrice*rng.uniform(0.7, 0.95), 4), 0.0001)
+    return ','.join(prices)
+
+def randomPart(rng, partIndex):
+    '''
+     [first category, second category, manufacturer part, package, description] of a made up part.
+     The descriptions use the same symbols as JLC's, they end up GBK encoded like the real file
+    '''
+    kind = rng.random()
+    if kind < 0.35:
+        package = rng.choice(chipPackages)
+        return ['Capacitors', 'Multilayer Ceramic Capacitors MLCC - SMD/SMT', 'CL{0:08d}'.format(partIndex), package,
+                '{0} {1} {2} ±{3} {4} Multilayer Ceramic Capacitors MLCC - SMD/SMT ROHS'.format(
+                    rng.choice(['6.3V', '10V', '16V', '25V', '50V', '100V']), rng.choice(capacitorValues),
+                    rng.choice(['X7R', 'X5R', 'C0G']), rng.choice(['5%', '10%', '20%']), package)]
+    if kind < 0.65:
+        package = rng.choice(chipPackages)
+        return ['Resistors', 'Chip Resistor - Surface Mount', 'RC{0:08d}'.format(partIndex), package,
+                '{0} Thick Film Resistors 75V ±{1} ±100ppm/℃ {2} {3} Chip Resistor - Surface Mount ROHS'.format(
+                    rng.choice(['62.5mW', '100mW', '125mW', '1/4W']), rng.choice(['1%', '5%']), rng.choice(resistorValues), package)]
+    if kind < 0.72:
+        package = rng.choice(chipPackages)
+        return ['Inductors & Chokes & Transformers', 'Inductors (SMD)', 'L{0:08d}'.format(partIndex), package,
+                '{0} ±20% {1}mA {2} Inductors (SMD) ROHS'.format(rng.choice(inductorValues), rng.choice([100, 300, 500, 1000]), package)]
+    if kind < 0.82:
+        package = rng.choice(diodePackages)
+        return ['Diodes', rng.choice(['Schottky Barrier Diodes (SBD)', 'Switching Diode', 'Zener Diodes']), 'D{0:08d}'.format(partIndex), package,
+                '{0} {1} {2} Diodes ROHS'.format(rng.choice(['40V', '75V', '100V']), rng.choice(['200mA', '1A', '3A']), package)]
+    firstCategory, secondCategory, description = rng.choice(icFunctions)
+    package = rng.choice(icPackages)
+    return [firstCategory, secondCategory, 'IC{0:08d}'.format(partIndex), package,
+            '{0} -40℃~+85℃ {1} {2} ROHS'.format(description, package, secondCategory)]
+
+def generateCsv(csvFilename, rows, seed=1):
+    # A catalogue in the same layout and GBK encoding as the file from JLC
+    rng = random.Random(seed)
+    with open(csvFilename, 'w', encoding='gbk', newline='') as csvFile:
+        writer = csv.writer(csvFile, lineterminator='\r\n')
+        writer.writerow(['LCSC Part', 'First Category', 'Second Category', 'MFR.Part', 'Package', 'Solder Joint',
+                         'Manufacturer', 'Library Type', 'Description', 'Datasheet', 'Price', 'Stock'])
+        for partIndex in range(rows):
+            firstCategory, secondCategory, mfrPart, package, description = randomPart(rng, partIndex)
+            lcscPart = 'C{0}'.format(1000 + partIndex)
+            stock = 0 if rng.random() < 0.4 else int(10**rng.uniform(0, 6))
+            writer.writerow([lcscPart, firstCategory, secondCategory, mfrPart, package, rng.choice([2, 3, 8, 16, 48]),
+                             rng.choice(manufacturers), 'Basic' if rng.random() < 0.03 else 'Extended', description,
+                             'https://datasheet.lcsc.com/lcsc/{0}.pdf'.format(lcscPart) if rng.random() < 0.8 else '',
+                             randomPriceString(rng), stock, ''])
+
+def generateBom(bomFilename, lines, catalogueRows, seed=1):
+    # A JLC style BOM with KiCad footprints, some lines already have a part
+    rng = random.Random(seed)
+    bom = []
+    for lineIndex in range(lines):
+        kind = rng.random()
+        size = rng.choice(['0402', '0603', '0805'])
+        metric = {'0402': '1005', '0603': '1608', '0805': '2012'}[size]
+        if kind < 0.45:
+            comment = rng.choice(capacitorValues).replace('μ', 'u')
+            footprint = 'C_{0}_{1}Metric'.format(size, metric)
+        elif kind < 0.85:
+            comment = rng.choice(resistorValues).replace('Ω', '')
+            footprint = 'R_{0}_{1}Metric'.format(size, metric)
+        elif kind < 0.92:
+            comment = 'microcontroller'
+            footprint = 'LQFP-48_7x7mm_P0.5mm'
+        else:
+            comment = 'LDO Regulator'
+            footprint = 'SOT-23-5'
+        lcscPart = 'C{0}'.format(1000 + rng.randrange(catalogueRows)) if rng.random() < 0.2 else ''
+        bom.append([comment, '{0}{1}'.format('C' if footprint.startswith('C_') else 'U', lineIndex + 1), footprint, lcscPart])
+    writeBom(bomFilename, bom)
+
+
+def timed(function, *args, **kwargs):
+    startTime = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, round(time.perf_counter() - startTime, 4)
+
+def searchLabel(keyWordList, packagesList):
+    return ' '.join(keyWordList) + (' in ' + ' '.join(packagesList) if len(packagesList) else '')
+
+def benchImport(csvFilename, dbFilename, processes):
+    # A full conversion, then an update with nothing changed (which is all hashing)
+    results = {}
+    for name, update in [('rebuild', False), ('update', True)]:
+        converter = Converter(csvFilename, dbFilename, False, None, update, processes=processes)
+        completed, seconds = timed(converter.run)
+        results[name] = dict(converter.stats, wallSeconds=seconds, completed=completed)
+    return results
+
+def benchSearch(dbFilename, repeat):
+    '''
+     For each sort order and search, the fastest time of a search on its own (first page read and
+     parts counted) and of the same search again when it's been cached. The fastest is the one least
+     upset by whatever else the machine was doing
+    '''
+    results = {}
+    for sortName, sortValue in sortOrders.items():
+        results[sortName] = {}
+        for keyWordList, packagesList in benchSearches:
+            firstTimes = []
+            cachedTimes = []
+            for repeatIndex in range(repeat):
+                searcher = PartSearcher(dbFilename)
+                for times in [firstTimes, cachedTimes]:
+                    startTime = time.perf_counter()
+                    pager = searcher.search(keyWordList, packagesList, True, sortValue, 1)
+                    rows = pager.nextRows(benchPageSize)
+                    parts = pager.count()
+                    times.append(time.perf_counter() - startTime)
+            results[sortName][searchLabel(keyWordList, packagesList)] = {'parts': parts, 'firstRows': len(rows),
+                                                                           'searchSeconds': round(min(firstTimes), 4),
+                                                                           'cachedSeconds': round(min(cachedTimes), 4)}
+    return results
+
+def benchBom(dbFilename, bomFilename, repeat):
+    # The fastest of repeat matches of the whole BOM, with and without extended parts
+    results = {}
+    lines = [(line[0], line[2]) for line in readBom(bomFilename)]
+    for name, useExtended in [('basic', False), ('extended', True)]:
+        matches = {}
+        def matched(rowIndex, row):
+            matches[rowIndex] = row
+        seconds = min(timed(BomMatcher(dbFilename, lines, useExtended, matched=matched).run)[1] for repeatIndex in range(repeat))
+        results[name] = {'lines': len(lines), 'matched': sum(row is not None for row in matches.values()),
+                         'matchSeconds': seconds, 'linesPerSecond': int(len(lines)/max(seconds, 1e-6))}
+    return results
+
+def benchTable(dbFilename, workDir):
+    '''
+     Times PartTable.searchPopulate and drawing the first screen of results, the way the Search
+     tab shows them. Needs PyQt5, runs without a display
+    '''
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtCore import QModelIndex
+        from PyQt5.QtWidgets import QApplication
+        import jlcqt
+    except ImportError as error:
+        return {'skipped': str(error)}
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # An empty image cache of its own so the results don't depend on what's been downloaded
+    imageDir = os.path.join(workDir, 'imageCache') + os.sep
+    os.makedirs(imageDir, exist_ok=True)
+    if os.path.isfile(imageCacheDir + defaultImage):
+        shutil.copy(imageCacheDir + defaultImage, imageDir)
+    table = jlcqt.PartTable(ImageCache(imageDir, imageDir + 'imageIndex.db', imageDir + 'failedParts.txt'))
+    table.resize(1200, 800)
+    table.show()
+
+    results = {}
+    for sortName, sortValue in sortOrders.items():
+        results[sortName] = {}
+        for keyWordList, packagesList in benchSearches:
+            pager = PartSearcher(dbFilename).search(keyWordList, packagesList, True, sortValue, 1)
+            startTime = time.perf_counter()
+            table.searchPopulate(pager, False)
+            # The view asks for the first rows once it's laid itself out again
+            while table.partModel.rowCount() == 0 and table.partModel.canFetchMore(QModelIndex()):
+                app.processEvents()
+            populateSeconds = time.perf_counter() - startTime
+            table.grab()
+            results[sortName][searchLabel(keyWordList, packagesList)] = {'rows': table.partModel.rowCount(),
+                                                                           'populateSeconds': round(populateSeconds, 4),
+                                                                           'drawSeconds': round(time.perf_counter() - startTime - populateSeconds, 4)}
+    table.close()
+    return results
+
+
+def secondsByName(results, prefix=''):
+    # Every time in the results, named by where it is in them, eg "search/stock/res/searchSeconds"
+    seconds = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            seconds.update(secondsByName(value, prefix + key + '/'))
+        elif key.endswith('Seconds') and isinstance(value, (int, float)):
+            seconds[prefix + key] = value
+    return seconds
+
+def compareResults(baseline, results, tolerance, minSeconds):
+    # Names of the times that have got more than tolerance slower, ignoring ones too short to measure well
+    baselineSeconds = secondsByName(baseline)
+    regressions = []
+    for name, seconds in sorted(secondsByName(results).items()):
+        before = baselineSeconds.get(name)
+        if before is not None and max(before, seconds) >= minSeconds and seconds > before*(1 + tolerance):
+            regressions.append('{0}: {1}s -> {2}s'.format(name, before, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time importing, searching, BOM matching and showing results with a made up JLC catalogue')
+    parser.add_argument('--rows', type=int, default=100000, help='parts in the catalogue (default: %(default)s)')
+    parser.add_argument('--bom-lines', type=int, default=300, help='lines in the BOM (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5, help='times each search and BOM match is run, the fastest is used')
+    parser.add_argument('--processes', type=int, default=importProcesses, help='processes converting rows')
+    parser.add_argument('--work-dir', help='where the CSV, BOM and database go (default: a temporary directory that is removed)')
+    parser.add_argument('--skip', nargs='+', default=[], choices=['import', 'search', 'bom', 'table'],
+                        help='leave these out (search, bom and table need the database from import, or one already in --work-dir)')
+    parser.add_argument('--out', help='write the results here as JSON as well as to stdout')
+    parser.add_argument('--compare', help='JSON results from an earlier run, exits with 1 if anything has got slower')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='how much slower counts as slower (default: %(default)s)')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='times shorter than this are not compared')
+    args = parser.parse_args(argv)
+
+    workDir = args.work_dir or tempfile.mkdtemp(prefix='jlcbench')
+    os.makedirs(workDir, exist_ok=True)
+    csvFilename = os.path.join(workDir, 'bench.csv')
+    bomFilename = os.path.join(workDir, 'benchBom.csv')
+    dbFilename = os.path.join(workDir, 'bench.db')
+
+    results = {'setup': {'rows': args.rows, 'bomLines': args.bom_lines, 'seed': args.seed, 'processes': args.processes,
+                         'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+                         'cpus': os.cpu_count()}}
+    try:
+        if not os.path.isfile(csvFilename) or 'import' not in args.skip:
+            print('Making {0} rows of catalogue'.format(args.rows), file=sys.stderr)
+            results['setup']['generateSeconds'] = timed(generateCsv, csvFilename, args.rows, args.seed)[1]
+            generateBom(bomFilename, args.bom_lines, args.rows, args.seed)
+        for name, bench, benchArgs in [('import', benchImport, (csvFilename, dbFilename, args.processes)),
+                                       ('search', benchSearch, (dbFilename, args.repeat)),
+                                       ('bom', benchBom, (dbFilename, bomFilename, args.repeat)),
+                                       ('table', benchTable, (dbFilename, workDir))]:
+            if name not in args.skip:
+                print('Timing {0}'.format(name), file=sys.stderr)
+                results[name] = bench(*benchArgs)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, 'w') as outFile:
+            outFile.write(output + '\n')
+
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            regressions = compareResults(json.load(baselineFile), results, args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print('Slower: ' + regression, file=sys.stderr)
+        return 1 if len(regressions) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,1911 @@
+#!/usr/bin/env python
+
+#############################################################################
+##
+## Copyright (C) 2021 Joe Skaife.
+## All rights reserved.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+## "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+## LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+## A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+## OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+## SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+## LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+## DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+## THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+## (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+## OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+#############################################################################
+
+import csv
+import io
+import sqlite3
+import os
+import sys
+import threading
+import itertools
+import hashlib
+import time
+import re
+import unicodedata
+import collections
+import urllib.parse
+import argparse
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from enum import IntEnum
+
+# The parts database, the image cache and BOM matching, with nothing that needs Qt so it can be used
+# from scripts and the command line (python jlccore.py --help) as well as by the GUI in jlcqt.py
+
+
+class SortEnum(IntEnum):
+    SORT_STOCK_DOWN = 1
+    SORT_PRICE_UP = 2
+    SORT_IN_STOCK_PRICE_UP = 3
+    
+class DbRowEnum(IntEnum):
+    DB_ROW_LCSC_PART = 0
+    DB_ROW_FIRST_CAT = 1
+    DB_ROW_SEC_CAT = 2
+    DB_ROW_MFR_PART = 3
+    DB_ROW_PACKAGE = 4
+    DB_ROW_SOLDER_JNT = 5
+    DB_ROW_MANF = 6
+    DB_ROW_LIB_TYPE = 7
+    DB_ROW_DESCR = 8
+    DB_ROW_DATASHEET = 9
+    DB_ROW_PRICE = 10
+    DB_ROW_STOCK = 11
+    DB_ROW_WORST_PRICE = 12
+    DB_ROW_MIN_QUANTITY = 13
+    DB_ROW_IMAGE = 14
+    DB_ROW_CONTENT_HASH = 15
+    DB_ROW_UNIT_PRICE = 16
+    DB_ROW_CANONICAL_PACKAGE = 17
+
+class JlcCsvColumnEnum(IntEnum):
+    JLC_CSV_COMMENT = 0
+    JLC_CSV_DES = 1
+    JLC_CSV_FOOT = 2
+    JLC_CSV_PART = 3
+    JLC_CSV_COUNT = 4
+
+imageCacheDir = 'imageCache/'
+failedPartsFile = imageCacheDir +'failedParts.txt'
+imageIndexFile = imageCacheDir + 'imageIndex.db'
+cellImageSize = 100
+tooltipImageSize = 300
+thumbnailSizes = [cellImageSize, tooltipImageSize]
+originalImageBudget = 2*1024**3  # Bytes of full size images kept, the oldest go first
+defaultImage = 'no_image.png'
+defaultDbFile = 'jlc.db'
+defaultBomOutFile = 'jlcBom.csv'
+timingLogFile = 'jlcTiming.log'   # Every phase timing goes here once logging is turned on
+searchCacheSize = 500000          # Part numbers kept from recent searches
+searchCacheLimit = 20000          # Searches that find more than this are read a page at a time and not cached
+searchNarrowLimit = 10000         # Past this many parts it's quicker to search from scratch than narrow a search
+numFetchedImages = 0
+
+# Image cache statuses, and why an image failed
+imageCached = 'cached'
+imageFailed = 'failed'
+imageMissing = 'missing'          # LCSC says there's no such image
+imageError = 'error'              # Network or server trouble, there might be one
+imageMissingExpiry = 90*24*3600   # Seconds before a missing image is looked for again
+imageErrorRetry = 10*60           # Seconds before retrying after an error, doubled each time it fails
+imageErrorRetryMax = 24*3600
+
+# Where part images come from, {name} is worked out by imageUrlName()
+imageUrlBase = 'https://assets.lcsc.com'
+imageUrlTemplates = ['{base}/images/lcsc/900x900/20180914_{name}_front.jpg',
+                     '{base}/images/lcsc/900x900/20180914_{name}_front_10.jpg',
+                     '{base}/images/lcsc/900x900/20180914_{name}_front_10.JPG',
+                     '{base}/images/lcsc/900x900/20180914_{name}_front_11.jpg',
+                     '{base}/images/lcsc/900x900/20280914_{name}_front.jpg',
+                     '{base}/images/lcsc/900x900/20180914_{name}_1.jpg',
+                     '{base}/images/lcsc/900x900/20180914_{name}_package.jpg',
+                     '{base}/images/lcsc/900x900/20200421_{name}_front.jpg'
+                     ]
+imageFetchConcurrency = 8
+imageFirstWaveShare = 0.8         # Try the templates that found this much of the images so far first
+bomMatchThreads = min(8, os.cpu_count() or 1)
+importProcesses = os.cpu_count() or 1   # Processes converting CSV rows, one means it's all done by the writer
+importChunkSize = 4*1024**2             # Bytes of CSV each process converts at a time
+
+# Names for the sort orders on the command line
+sortOrders = {'stock': SortEnum.SORT_STOCK_DOWN, 'price': SortEnum.SORT_PRICE_UP, 'instock': SortEnum.SORT_IN_STOCK_PRICE_UP}
+
+# Bump this whenever the jlc table changes so old databases get rebuilt rather than updated
+dbSchemaVersion = 6
+jlcColumns = ['LCSCPart', 'FirstCategory', 'SecondCategory', 'MFRPart', 'Package', 'SolderJoint', 'Manufacturer', 'LibraryType',
+              'Description', 'Datasheet', 'Price', 'Stock', 'worstPrice', 'minQuantity', 'image', 'contentHash', 'unitPrice', 'canonicalPackage']
+# The kinds of value in the jlcValue table, the ones that narrow a search down most first
+parameterKinds = ['capacitance', 'resistance', 'inductance', 'voltage', 'tolerance', 'power']
+
+# Columns that plain keywords are matched against (footprint fragments also look at Package)
+searchColumns = ['FirstCategory', 'SecondCategory', 'Description', 'MFRPart']
+footprintColumns = searchColumns + ['Package']
+
+# EDA footprint names like C_0402_1005Metric or SOIC-8_3.9x4.9mm_P1.27mm and JLC packages like 0402 or
+# SOIC-8_150mil boil down to the same canonical package, so footprints can be looked up by equality
+chipPackageSizes = ['01005', '0201', '0402', '0603', '0805', '1206', '1210', '1806', '1812', '2010', '2220', '2512']
+metricChipSizes = {'0402': '01005', '0603': '0201', '1005': '0402', '1608': '0603', '2012': '0805', '3216': '1206',
+                   '3225': '1210', '4516': '1806', '4532': '1812', '5025': '2010', '5750': '2220', '6332': '2512'}
+footprintTypePrefixes = ['C', 'CP', 'R', 'L', 'D', 'LED', 'F', 'FUSE']
+packageAliases = {'SOT-23-3': 'SOT-23', 'TO-236': 'SOT-23', 'TO-236-3': 'SOT-23', 'SOT-323-3': 'SOT-323', 'SC-70': 'SOT-323',
+                  'SOT-89-3': 'SOT-89', 'SOT-223-3': 'SOT-223', 'SO-8': 'SOIC-8'}
+metricChipPattern = re.compile(r'^(\d{4})METRIC$')
+packageRemarkPattern = re.compile(r'\(.*\)$')   # SMA(DO-214AC)
+
+# The trigram tokenizer can't find anything shorter than 3 characters, those fall back to LIKE
+ftsMinKeywordLength = 3
+
+
+# Stand-ins for price breaks with no upper limit and prices that can't be read
+openEndedQuantity = 2**31 - 1
+unknownPrice = 99999999
+
+# Component values in descriptions, eg "50V 100nF X7R +/-10% 0402" or "4.7KR +/-1% 1/16W 0603" (the R
+# is an Ohm symbol after fixUpOddChars). Stored in F, Ohms, H, V, % and W
+siPrefixes = {'p': 1e-12, 'n': 1e-9, 'u': 1e-6, '\u00b5': 1e-6, '\u03bc': 1e-6, 'm': 1e-3, '': 1,
+              'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9}
+valueNumber = r'(?<![\w.])(\d+(?:\.\d+)?)'
+parameterPatterns = {'capacitance': re.compile(valueNumber + r' ?([pnu\u00b5\u03bcm]?)F(?![A-Za-z])'),
+                     'resistance':  re.compile(valueNumber + r' ?([mkKMG]?)(?:R|\u03a9|[Oo]hms?)(?![A-Za-z])'),
+                     'inductance':  re.compile(valueNumber + r' ?([pnu\u00b5\u03bcm]?)H(?![A-Za-z])'),
+                     'voltage':     re.compile(valueNumber + r' ?([mk]?)V(?:DC|AC)?(?![A-Za-z])'),
+                     'tolerance':   re.compile(r'(?:\+/-|\u00b1) ?(\d+(?:\.\d+)?)()%'),
+                     'power':       re.compile(r'(?<![\w./])(\d+(?:\.\d+)?(?:/\d+)?) ?([mk]?)W(?![A-Za-z])')}
+
+# A search keyword that is a value on its own: 10nF, .1uf, 100r, 16v, 1/4W, 1%, or 4k7 style resistances
+valueKeywordPattern = re.compile(r'^(?:\+/-|\u00b1)?(\d+(?:\.\d+)?(?:/\d+)?|\.\d+)([pPnNuU\u00b5\u03bcmMkKgG]?)([a-zA-Z\u03a9\u03c9%]*)$')
+rkmKeywordPattern = re.compile(r'^(\d+)([rRkKmM])(\d+)$')
+valueKeywordUnits = {'f': 'capacitance', 'h': 'inductance', 'v': 'voltage', 'w': 'power', '%': 'tolerance',
+                     'r': 'resistance', '\u03c9': 'resistance', 'ohm': 'resistance', 'ohms': 'resistance'}
+valueMatchTolerance = 1e-6   # Relative, 0.01uF and 10nF don't come out as exactly the same float
+
+
+def parsePriceBreaks(priceString):
+    '''
+     Split JLC's "1-9:0.05,10-99:0.04,100-:0.03" price string into (minQty, maxQty, unitPrice) tuples.
+     There's always at least one, a price on its own applies to any quantity
+    '''
+    priceBreaks = []
+    for price in priceString.split(','):
+        priceFor = price.split(':')
+        if len(priceFor) > 1:
+            pricePart = priceFor[1]
+            quantities = priceFor[0].split('-')
+            try:
+                minQty = int(quantities[0])
+            except ValueError:
+                minQty = 1
+            try:
+                maxQty = int(quantities[1])
+            except (IndexError, ValueError):
+                maxQty = openEndedQuantity
+        else:
+            # Not a range of prices
+            pricePart = price
+            minQty = 1
+            maxQty = openEndedQuantity
+
+        try:
+            unitPrice = float(pricePart)
+        except ValueError:
+            # Sometimes the price is nonsense or omitted
+            unitPrice = unknownPrice
+        priceBreaks.append((minQty, maxQty, unitPrice))
+    return priceBreaks
+
+def parseNumber(number):
+    # A float from a number that might be a fraction like 1/16, None for nonsense like 1/0
+    if '/' in number:
+        numerator, denominator = number.split('/')
+        return float(numerator) / float(denominator) if float(denominator) != 0 else None
+    return float(number)
+
+def parseParameters(description):
+    '''
+     Every value in a description as (kind, value), kinds being parameterKinds. There can be several of
+     a kind, "30V 5.8A 1.4W 28mOhm@10V" is both 30V and 10V
+    '''
+    values = []
+    for kind in parameterKinds:
+        for match in parameterPatterns[kind].finditer(description):
+            number = parseNumber(match.group(1))
+            if number is None:
+                continue
+            value = (kind, number * siPrefixes[match.group(2)])
+            if value not in values:
+                values.append(value)
+    return values
+
+def canonicalPackage(name):
+    '''
+     The canonical package for a JLC package or an EDA footprint: C_0402_1005Metric, 0402 and
+     R_0402_1005Metric_Pad0.72x0.64mm_HandSolder are all 0402, SOIC-8_150mil and SOIC-8_3.9x4.9mm_P1.27mm
+     are both SOIC-8. '' if there's nothing to go on
+    '''
+    fragments = [fragment for fragment in name.split(':')[-1].strip().upper().split('_') if fragment != '']
+    if len(fragments) > 1 and fragments[0] in footprintTypePrefixes:
+        fragments = fragments[1:]
+    if len(fragments) == 0:
+        return ''
+    package = packageRemarkPattern.sub('', fragments[0])
+    match = metricChipPattern.match(package)
+    if match is not None and match.group(1) in metricChipSizes:
+        return metricChipSizes[match.group(1)]
+    return packageAliases.get(package, package)
+
+def hasPackage(cur, package):
+    # Whether any part has this canonical package, straight off the index
+    cur.execute("SELECT 1 FROM jlc WHERE canonicalPackage = ? LIMIT 1", (package,))
+    return cur.fetchone() is not None
+
+def packageCondition(cur, packages, useFts):
+    '''
+     SQL condition (and parameters) for parts in any of the packages. Packages that are in the database
+     once canonicalised are an indexed equality, anything else (LQFP on its own, say) is still matched as text
+    '''
+    canonicalPackages = []
+    otherPackages = []
+    for package in packages:
+        canonical = canonicalPackage(package)
+        if canonical != '' and hasPackage(cur, canonical):
+            if canonical not in canonicalPackages:
+                canonicalPackages.append(canonical)
+        else:
+            otherPackages.append(package)
+
+    conditions = []
+    params = []
+    if len(canonicalPackages) > 0:
+        conditions.append('jlc.canonicalPackage IN ({0})'.format(','.join('?' * len(canonicalPackages))))
+        params += canonicalPackages
+    otherCondition, otherParams = keywordCondition(otherPackages, ['Package'], useFts, 'OR')
+    if otherCondition != '':
+        conditions.append(otherCondition)
+        params += otherParams
+
+    if len(conditions) == 0:
+        return '', []
+    return '(' + ' OR '.join(conditions) + ')', params
+
+def parseValueKeyword(keyWord):
+    '''
+     (parameter column, value) if a search keyword is a component value, otherwise None. Keywords are
+     typed in any case, so prefixes mean what they'd usually mean for the unit: 1m or 1M on their own
+     are megohms and 1mR is milliohms, but a plain number could be anything so isn't a value
+    '''
+    match = rkmKeywordPattern.match(keyWord)
+    if match is not None:
+        whole, prefix, fraction = match.groups()
+        return 'resistance', float(whole + '.' + fraction) * {'r': 1, 'k': 1e3, 'm': 1e6}[prefix.lower()]
+
+    match = valueKeywordPattern.match(keyWord)
+    if match is None:
+        return None
+    number, prefix, unit = match.groups()
+    unit = unit.lower()
+    if unit == '':
+        if '/' in number:
+            return None
+        if prefix.lower() == 'k':
+            return 'resistance', float(number) * 1e3
+        if prefix.lower() == 'm':
+            return 'resistance', float(number) * 1e6
+        return None
+    if unit not in valueKeywordUnits:
+        return None
+    column = valueKeywordUnits[unit]
+    number = parseNumber(number)
+    if number is None:
+        return None
+    if prefix in ('m', 'M'):
+        multiplier = 1e6 if prefix == 'M' and column == 'resistance' else 1e-3
+    else:
+        multiplier = siPrefixes[prefix if prefix in siPrefixes else prefix.lower()]
+    return column, number * multiplier
+
+def setBulkLoadPragmas(cur):
+    '''
+     Trade safety for speed while the database is being built, if the conversion dies part way
+     the database is thrown away anyway
+    '''
+    cur.execute("PRAGMA journal_mode = WAL")
+    cur.execute("PRAGMA synchronous = OFF")
+    cur.execute("PRAGMA cache_size = -262144")   # 256MB
+    cur.execute("PRAGMA temp_store = MEMORY")
+
+def removeDatabaseFiles(dbFilename):
+    # The database along with any write-ahead log it has
+    for filename in [dbFilename, dbFilename + '-wal', dbFilename + '-shm']:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+def createIndexes(cur):
+    # Called once all the rows are in. These match the ORDER BY for each of the SortEnum orders
+    cur.execute("CREATE INDEX jlc_type_stock ON jlc (LibraryType, Stock DESC)")
+    cur.execute("CREATE INDEX jlc_type_unit_price ON jlc (LibraryType, unitPrice)")
+    cur.execute("CREATE INDEX jlc_price_unit_price ON jlcPrice (unitPrice)")
+    cur.execute("CREATE INDEX jlc_package ON jlc (canonicalPackage, LibraryType, Stock DESC)")
+    cur.execute("CREATE INDEX jlc_value_kind ON jlcValue (kind, value)")
+    cur.execute("ANALYZE jlc")
+    cur.execute("ANALYZE jlcPrice")
+    cur.execute("ANALYZE jlcValue")
+    createFtsIndex(cur)
+    
+    # Only a complete database gets a version, so a half converted one is never updated in place
+    cur.execute("PRAGMA user_version = {0}".format(dbSchemaVersion))
+
+def databaseSchemaVersion(dbFilename):
+    # 0 if there's no database or it predates versioning
+    if not os.path.isfile(dbFilename):
+        return 0
+    con = sqlite3.connect(dbFilename)
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    con.close()
+    return version
+
+def rowContentHash(row):
+    # Fingerprint of a raw CSV row so an update can tell whether anything about the part changed
+    return hashlib.blake2b('\x1f'.join(row).encode('utf-8'), digest_size=8).hexdigest()
+
+def createFtsIndex(cur):
+    '''
+     Full text index over the searchable columns, the content stays in the jlc table so it
+     doesn't double the size of the database
+    '''
+    ftsColumns = footprintColumns
+    cur.execute('''CREATE VIRTUAL TABLE jlc_fts USING fts5
+                   ({0}, content='jlc', tokenize='trigram')'''.format(', '.join(ftsColumns)))
+    cur.execute("INSERT INTO jlc_fts(jlc_fts) VALUES('rebuild')")
+
+    # Keep it in step when an update changes parts, but only when a searchable column actually changes
+    newValues = ', '.join('new.' + column for column in ftsColumns)
+    oldValues = ', '.join('old.' + column for column in ftsColumns)
+    cur.execute('''CREATE TRIGGER jlc_fts_insert AFTER INSERT ON jlc BEGIN
+                       INSERT INTO jlc_fts(rowid, {0}) VALUES (new.rowid, {1});
+                   END'''.format(', '.join(ftsColumns), newValues))
+    cur.execute('''CREATE TRIGGER jlc_fts_delete AFTER DELETE ON jlc BEGIN
+                       INSERT INTO jlc_fts(jlc_fts, rowid, {0}) VALUES ('delete', old.rowid, {1});
+                   END'''.format(', '.join(ftsColumns), oldValues))
+    cur.execute('''CREATE TRIGGER jlc_fts_update AFTER UPDATE ON jlc
+                   WHEN {2} BEGIN
+                       INSERT INTO jlc_fts(jlc_fts, rowid, {0}) VALUES ('delete', old.rowid, {3});
+                       INSERT INTO jlc_fts(rowid, {0}) VALUES (new.rowid, {1});
+                   END'''.format(', '.join(ftsColumns), newValues,
+                                 ' OR '.join('old.{0} IS NOT new.{0}'.format(column) for column in ftsColumns), oldValues))
+
+def hasFtsIndex(cur):
+    # Databases converted by older versions don't have the index
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'jlc_fts'")
+    return cur.fetchone() is not None
+
+def keywordCondition(keyWordList, columns, useFts, joiner='AND', matchValues=True, valueIndex=True):
+    '''
+     Build an SQL condition (and its parameters) requiring each keyword to appear in any of the columns.
+     Keywords are joined with AND (or OR for the package list) and matched case insensitively.
+     When the description is one of the columns, keywords that are values like 10nF match any of the
+     part's parsed values of that kind instead, so 0.01uF and 10000pF are found too (parts without a
+     value of that kind still go by text). With valueIndex one value is looked up in the value index,
+     so SQLite can start from the parts that have it, which suits finding all the matches. Other
+     values are checked part by part, which suits finding the first few in some order
+    '''
+    values = [parseValueKeyword(keyWord) if matchValues and 'Description' in columns else None for keyWord in keyWordList]
+    indexedValue = None
+    if valueIndex:
+        valueOrder = [(parameterKinds.index(value[0]), keyIndex) for keyIndex, value in enumerate(values) if value is not None]
+        if len(valueOrder) > 0:
+            indexedValue = min(valueOrder)[1]
+
+    conditions = []
+    params = []
+    ftsTerms = []
+    for keyIndex, keyWord in enumerate(keyWordList):
+        value = values[keyIndex]
+        if value is not None:
+            kind, number = value
+            textCondition, textParams = keywordCondition([keyWord], columns, useFts, matchValues=False)
+            if keyIndex == indexedValue:
+                # Both sides of the OR can then use an index, so SQLite only looks at the parts either of them finds
+                valueCondition = 'jlc.LCSCPart IN (SELECT LCSCPart FROM jlcValue WHERE kind = ? AND value BETWEEN ? AND ?)'
+            else:
+                valueCondition = 'EXISTS (SELECT 1 FROM jlcValue WHERE jlcValue.LCSCPart = jlc.LCSCPart AND kind = ? AND value BETWEEN ? AND ?)'
+            conditions.append('({0} OR ({1} AND NOT EXISTS (SELECT 1 FROM jlcValue WHERE jlcValue.LCSCPart = jlc.LCSCPart AND kind = ?)))'.format(
+                              valueCondition, textCondition))
+            params += [kind, number * (1 - valueMatchTolerance), number * (1 + valueMatchTolerance)] + textParams + [kind]
+            continue
+
+        keyWord = keyWord.lower()
+        if keyWord == '':
+            continue
+        if useFts and len(keyWord) >= ftsMinKeywordLength:
+            ftsTerms.append('{' + ' '.join(columns) + '} : "' + keyWord.replace('"', '""') + '"')
+        else:
+            conditions.append('(' + ' OR '.join('LOWER({0}) LIKE ?'.format(column) for column in columns) + ')')
+            params += ['%' + keyWord + '%'] * len(columns)
+
+    # All the indexed keywords go through a single MATCH
+    if len(ftsTerms) > 0:
+        conditions.insert(0, 'jlc.rowid IN (SELECT rowid FROM jlc_fts WHERE jlc_fts MATCH ?)')
+        params.insert(0, ' {0} '.format(joiner).join(ftsTerms))
+
+    if len(conditions) == 0:
+        return '', []
+    return '(' + ' {0} '.format(joiner).join(conditions) + ')', params
+
+
+def partRows(cur, lcscParts, chunkSize=500):
+    # {part number: jlc row} for the part numbers that are in the database. They're looked up chunkSize
+    # at a time, well under SQLite's limit on parameters
+    lcscParts = list(set(part for part in lcscParts if part != ''))
+    found = {}
+    for start in range(0, len(lcscParts), chunkSize):
+        chunk = lcscParts[start:start + chunkSize]
+        cur.execute("SELECT * FROM jlc WHERE LCSCPart IN ({0})".format(','.join('?' * len(chunk))), chunk)
+        for row in cur.fetchall():
+            found[row[DbRowEnum.DB_ROW_LCSC_PART]] = row
+    return found
+
+
+class PhaseTimings:
+    '''
+     How long each phase of the work (SQL, reading rows, filling the table, loading and downloading
+     images...) has taken, so it's possible to tell where the time goes when something feels slow.
+     Each time can also be written to a log, once startLog() has been called. Safe for any thread
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = collections.OrderedDict()    # phase: [count, total seconds, most seconds, last seconds]
+        self.logFile = None
+
+    def record(self, phase, seconds, detail=''):
+        with self.lock:
+            times = self.phases.get(phase)
+            if times is None:
+                times = self.phases[phase] = [0, 0.0, 0.0, 0.0]
+            times[0] += 1
+            times[1] += seconds
+            times[2] = max(times[2], seconds)
+            times[3] = seconds
+            if self.logFile is not None:
+                self.logFile.write('{0} {1} {2:.6f} {3}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S'), phase, seconds, detail))
+
+    def startLog(self, logFilename=timingLogFile):
+        # Line buffered so the log is up to date if it's looked at while running
+        with self.lock:
+            if self.logFile is None:
+                self.logFile = open(logFilename, 'a', buffering=1)
+
+    def stopLog(self):
+        with self.lock:
+            if self.logFile is not None:
+                self.logFile.close()
+                self.logFile = None
+
+    def clear(self):
+        with self.lock:
+            self.phases.clear()
+
+    def stats(self):
+        with self.lock:
+            return {phase: {'count': count, 'totalSeconds': total, 'maxSeconds': most, 'lastSeconds': last}
+                    for phase, (count, total, most, last) in self.phases.items()}
+
+    def report(self):
+        # A table of the timings so far, for people to read
+        lines = ['{0:<16}{1:>8}{2:>12}{3:>12}{4:>12}{5:>12}'.format('Phase', 'Count', 'Total ms', 'Mean ms', 'Max ms', 'Last ms')]
+        for phase, times in sorted(self.stats().items()):
+            lines.append('{0:<16}{1:>8}{2:>12.1f}{3:>12.2f}{4:>12.2f}{5:>12.2f}'.format(
+                phase, times['count'], 1000*times['totalSeconds'], 1000*times['totalSeconds']/times['count'],
+                1000*times['maxSeconds'], 1000*times['lastSeconds']))
+        return '\n'.join(lines)
+
+phaseTimings = PhaseTimings()
+
+def queryPlan(cur, sqlCommand, params):
+    # SQLite's EXPLAIN QUERY PLAN for a statement, as lines indented the way the sqlite3 shell shows them
+    cur.execute("EXPLAIN QUERY PLAN " + sqlCommand, params)
+    depths = {0: 0}
+    lines = []
+    for nodeId, parentId, notUsed, detail in cur.fetchall():
+        depths[nodeId] = depths.get(parentId, 0) + 1
+        lines.append('  '*depths[nodeId] + detail)
+    return lines
+
+
+# Everything that decides what a search finds
+SearchKey = collections.namedtuple('SearchKey', ['dbFilename', 'sortValue', 'quantity', 'useExtended', 'keyWords', 'packages'])
+
+class SearchCache:
+    '''
+     The part numbers recent searches found, in order, keyed on everything that decides the result
+     (a SearchKey). Going back to a search doesn't have to work it out again, and a search that only
+     narrows a cached one can be run over just the parts that one found. The least recently used
+     searches are dropped once there are more than maxParts part numbers in all
+    '''
+    def __init__(self, maxParts=searchCacheSize):
+        self.maxParts = maxParts
+        self.searches = collections.OrderedDict()
+        self.totalParts = 0
+        self.hits = 0
+        self.narrowed = 0
+        self.misses = 0
+
+    @staticmethod
+    def searchKey(dbFilename, keyWords, packages, useExtended, sortValue, quantity):
+        # Keywords are ANDed and packages ORed, so neither order matters
+        return SearchKey(dbFilename, sortValue, quantity, useExtended, frozenset(keyWords), frozenset(packages))
+
+    def get(self, key):
+        parts = self.searches.get(key)
+        if parts is not None:
+            self.hits += 1
+            self.searches.move_to_end(key)
+        return parts
+
+    def narrows(self, key, cachedKey):
+        '''
+         Whether everything key finds is in what cachedKey found: the same database, order and quantity
+         with more keywords, fewer of the cached packages (none means any) or Basic parts only
+        '''
+        return (key != cachedKey and (key.dbFilename, key.sortValue, key.quantity) == (cachedKey.dbFilename, cachedKey.sortValue, cachedKey.quantity)
+                and (cachedKey.useExtended or not key.useExtended) and cachedKey.keyWords <= key.keyWords
+                and (len(cachedKey.packages) == 0 or (len(key.packages) > 0 and key.packages <= cachedKey.packages)))
+
+    def superset(self, key):
+        # (key, parts) for the smallest cached result that key narrows, if it's small enough to be worth it
+        best = None
+        for cachedKey, parts in self.searches.items():
+            if (len(parts) <= searchNarrowLimit and self.narrows(key, cachedKey)
+                    and (best is None or len(parts) < len(best[1]))):
+                best = (cachedKey, parts)
+        if best is None:
+            self.misses += 1
+        else:
+            self.narrowed += 1
+        return best
+
+    def put(self, key, parts):
+        if key in self.searches:
+            self.totalParts -= len(self.searches.pop(key))
+        self.searches[key] = parts
+        self.totalParts += len(parts)
+        while self.totalParts > self.maxParts and len(self.searches) > 1:
+            oldKey, oldParts = self.searches.popitem(last=False)
+            self.totalParts -= len(oldParts)
+
+    def clear(self):
+        self.searches.clear()
+        self.totalParts = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'narrowed': self.narrowed, 'misses': self.misses,
+                'searches': len(self.searches), 'parts': self.totalParts}
+
+
+def databaseProblem(dbFilename):
+    # Why a database can't be searched, or None if it can
+    if not os.path.isfile(dbFilename):
+        return 'Can\'t find database file: {0}'.format(dbFilename)
+    if databaseSchemaVersion(dbFilename) != dbSchemaVersion:
+        return '{0} was made by a different version of this program, please convert the CSV file again'.format(dbFilename)
+    return None
+
+def readBom(bomFilename):
+    # [comment, designator, footprint, LCSC part] for each line of a JLC style BOM, without the header
+    bom = []
+    with open(bomFilename, newline='') as csvFile:
+        reader = csv.reader(csvFile,delimiter=',')
+        for row in reader:
+            if len(row) and row[JlcCsvColumnEnum.JLC_CSV_COMMENT] != 'Comment':
+                bom.append([row[JlcCsvColumnEnum.JLC_CSV_COMMENT],
+                            row[JlcCsvColumnEnum.JLC_CSV_DES],
+                            row[JlcCsvColumnEnum.JLC_CSV_FOOT],
+                            row[JlcCsvColumnEnum.JLC_CSV_PART]])
+    return bom
+
+def writeBom(bomFilename, bom):
+    # Lines like readBom's, in the form JLC wants them
+    with open(bomFilename, 'w') as bomFile:
+        bomFile.write('Comment,Designator,Footprint,LCSC Part #\n')
+        for commentData, designator, footprintData, lcscPart in bom:
+            bomFile.write(commentData + ',' + designator + ',' + footprintData + ',' + lcscPart + '\n')
+
+
+def keysetCondition(sortColumns, lastValues):
+    '''
+     SQL condition (and parameters) for the rows after lastValues in the order given by sortColumns, a list
+     of (column, descending). For (a, b) that's a > x OR (a = x AND b > y), which SQLite can use an index for
+    '''
+    condition = None
+    params = []
+    for (column, descending), value in reversed(list(zip(sortColumns, lastValues))):
+        comparison = '<' if descending else '>'
+        if condition is None:
+            condition = '{0} {1} ?'.format(column, comparison)
+            params = [value]
+        else:
+            condition = '({0} {1} ? OR ({0} = ? AND {2}))'.format(column, comparison, condition)
+            params = [value, value] + params
+    return condition, params
+
+
+class SearchPager:
+    '''
+     Reads a search's rows a page at a time, each page carrying on from the last row of the one before
+     in the sort order (keyset pagination), so rows nobody has scrolled down to are never read. The
+     last of sortColumns must make the order unique. The SQL for each kind of query it runs is put in
+     queries, if it's given, so it can be explained
+    '''
+    def __init__(self, con, fromClause, fromParams, conditions, params, sortColumns, queries=None):
+        self.con = con
+        self.fromClause = fromClause
+        self.fromParams = fromParams
+        self.conditions = conditions
+        self.params = params
+        self.sortColumns = sortColumns
+        self.lastValues = None
+        self.finished = False
+        self.total = None
+        self.queries = queries
+
+    def query(self, columns, conditions, params, limit=None):
+        sqlCommand = "SELECT {0} FROM {1} ".format(columns, self.fromClause)
+        if len(conditions) > 0:
+            sqlCommand += "WHERE " + ' AND '.join(conditions) + " "
+        sqlCommand += "ORDER BY " + ', '.join(column + (' DESC' if descending else ' ASC') for column, descending in self.sortColumns)
+        if limit is not None:
+            sqlCommand += " LIMIT {0}".format(limit)
+        if self.queries is not None:
+            self.queries['all' if limit is None else 'page'] = (sqlCommand, self.fromParams + params)
+        cur = self.con.cursor()
+        # Executing runs the query as far as the first row (all of it, if it has to be sorted)
+        startTime = time.perf_counter()
+        cur.execute(sqlCommand, self.fromParams + params)
+        fetchTime = time.perf_counter()
+        rows = cur.fetchall()
+        phaseTimings.record('sql.execute', fetchTime - startTime, sqlCommand)
+        phaseTimings.record('sql.fetch', time.perf_counter() - fetchTime, '{0} rows'.format(len(rows)))
+        return rows
+
+    def count(self):
+        if self.total is None:
+            cur = self.con.cursor()
+            sqlCommand = "SELECT COUNT(*) FROM " + self.fromClause
+            if len(self.conditions) > 0:
+                sqlCommand += " WHERE " + ' AND '.join(self.conditions)
+            if self.queries is not None:
+                self.queries['count'] = (sqlCommand, self.fromParams + self.params)
+            startTime = time.perf_counter()
+            cur.execute(sqlCommand, self.fromParams + self.params)
+            self.total = cur.fetchone()[0]
+            phaseTimings.record('sql.count', time.perf_counter() - startTime, '{0} parts'.format(self.total))
+        return self.total
+
+    def allParts(self):
+        # Every part number the search finds, in order
+        return [row[0] for row in self.query('jlc.LCSCPart', self.conditions, self.params)]
+
+    def nextRows(self, count):
+        conditions = self.conditions
+        params = self.params
+        if self.lastValues is not None:
+            keysetSql, keysetParams = keysetCondition(self.sortColumns, self.lastValues)
+            conditions = conditions + [keysetSql]
+            params = params + keysetParams
+        columns = 'jlc.*, ' + ', '.join(column for column, descending in self.sortColumns)
+        rows = self.query(columns, conditions, params, count)
+        if len(rows) < count:
+            self.finished = True
+        if len(rows) > 0:
+            self.lastValues = rows[-1][len(jlcColumns):]
+        return [row[:len(jlcColumns)] for row in rows]
+
+
+class PartListPager:
+    '''
+     The same as a SearchPager for a search that's already a list of part numbers, like a cached one.
+     readRows turns some of the part numbers into rows
+    '''
+    def __init__(self, parts, readRows):
+        self.parts = parts
+        self.readRows = readRows
+        self.nextPart = 0
+        self.finished = len(parts) == 0
+        self.total = len(parts)
+
+    def count(self):
+        return self.total
+
+    def nextRows(self, count):
+        parts = self.parts[self.nextPart:self.nextPart + count]
+        self.nextPart += len(parts)
+        self.finished = self.nextPart >= len(self.parts)
+        # Parts an update has removed since the search just don't turn up
+        return self.readRows(parts)
+
+
+class BomResolver:
+    '''
+     Looks up BOM lines over one connection: every line that already has an LCSC part number in a
+     handful of IN (...) queries, and the best match for a line's comment and footprint asking only
+     for the top row. readOnly connections can be shared out to threads by BomMatchWorker
+    '''
+    def __init__(self, dbFilename, readOnly=False):
+        if readOnly:
+            self.con = sqlite3.connect('file:{0}?mode=ro'.format(urllib.parse.quote(os.path.abspath(dbFilename))),
+                                       uri=True, check_same_thread=False)
+        else:
+            self.con = sqlite3.connect(dbFilename)
+        self.cur = self.con.cursor()
+        self.useFts = hasFtsIndex(self.cur)
+        self.packagesFound = {}    # canonical package: whether it's in the database
+
+    def close(self):
+        self.con.close()
+
+    def knownParts(self, lcscParts):
+        # {part number: jlc row} for the part numbers that are in the database
+        return partRows(self.cur, lcscParts)
+
+    def bestMatch(self, comment, footprint, useExtended):
+        # The basic part (then the one with most stock) matching a BOM line's comment and footprint, or None
+        conditions = []
+        if not useExtended:
+            conditions.append("LibraryType='Basic'")
+
+        # Only the best match is wanted, quickest found by checking parts in order of stock
+        commentCondition, commentParams = keywordCondition(comment.split(' '), searchColumns, self.useFts, valueIndex=False)
+        footprintCondition, footprintParams = self.footprintCondition(footprint)
+        conditions += [condition for condition in [commentCondition, footprintCondition] if condition != '']
+
+        sqlCommand = "SELECT * FROM jlc "
+        if len(conditions) > 0:
+            sqlCommand += "WHERE " + ' AND '.join(conditions)
+        sqlCommand += " ORDER BY LibraryType ASC, Stock DESC LIMIT 1"
+        self.cur.execute(sqlCommand, commentParams + footprintParams)
+        return self.cur.fetchone()
+
+    def footprintCondition(self, footprint):
+        # Footprints of a package in the database are an indexed equality, otherwise each fragment is a keyword
+        package = canonicalPackage(footprint)
+        if package not in self.packagesFound:
+            self.packagesFound[package] = package != '' and hasPackage(self.cur, package)
+        if self.packagesFound[package]:
+            return 'jlc.canonicalPackage = ?', [package]
+        return keywordCondition(footprint.split('_'), footprintColumns, self.useFts, valueIndex=False)
+
+                 
+# The jlc columns imageUrlName() and fetching use, the part first
+imageNameColumns = (DbRowEnum.DB_ROW_LCSC_PART, DbRowEnum.DB_ROW_MANF, DbRowEnum.DB_ROW_MFR_PART, DbRowEnum.DB_ROW_DATASHEET)
+
+def imageUrlName(row):
+    '''
+     There are a number of variations of the url for the image - some of which look like typos
+     All are based on the datasheet name (for want of a better algorithm)
+     Returns None if there's nothing to base the name on
+    '''
+    if row[DbRowEnum.DB_ROW_DATASHEET].strip() == '':
+        # If there's no datasheet, best guess to image name is manufacture-partNumber_lcscPartNumber
+        return row[DbRowEnum.DB_ROW_MANF] + '-' + row[DbRowEnum.DB_ROW_MFR_PART] + '_' + row[DbRowEnum.DB_ROW_LCSC_PART]
+    try:
+        # Extract the part of the datasheet name that is useful
+        splitDatasheet = row[DbRowEnum.DB_ROW_DATASHEET].split('_', 1)
+        splitDatasheet = splitDatasheet[1].rsplit('.', 1)
+        return splitDatasheet[0]
+    except:
+        return None
+
+
+class ImageCache:
+    '''
+     Which parts have an image in the cache directory and which have no image to be had, along with
+     the URL template that worked and when. It's kept in a small database next to the images so
+     nothing has to list the directory, and is read into a dict the first time it's needed so
+     lookups don't touch the disk. A new index is seeded from the directory and failedParts.txt.
+     Every image gets a thumbnail for each of thumbnailSizes, which is all the GUI ever shows, so the
+     full size images are only kept up to originalBudget bytes.
+     Failures aren't forever: each has a time after which it's worth another try, soon for errors
+     and much later for images LCSC says it hasn't got
+    '''
+    def __init__(self, cacheDir=imageCacheDir, indexFile=imageIndexFile, failedFile=failedPartsFile,
+                 originalBudget=originalImageBudget):
+        self.cacheDir = cacheDir
+        self.indexFile = indexFile
+        self.failedFile = failedFile
+        self.originalBudget = originalBudget
+        self.lock = threading.Lock()
+        self.con = None
+        self.statuses = None
+        self.retryTimes = {}
+        self.templateHits = collections.Counter()
+        self.originalBytes = 0
+
+    def load(self):
+        # Call with the lock held
+        if self.statuses is not None:
+            return
+        self.con = sqlite3.connect(self.indexFile, check_same_thread=False)
+        cur = self.con.cursor()
+        cur.execute("PRAGMA journal_mode = WAL")
+        cur.execute("PRAGMA synchronous = NORMAL")
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'images'")
+        if cur.fetchone() is None:
+            cur.execute("BEGIN")
+            cur.execute("CREATE TABLE images (LCSCPart TEXT PRIMARY KEY, status TEXT, template INTEGER, fetched REAL, "
+                        "originalBytes INTEGER DEFAULT 0, reason TEXT, attempts INTEGER DEFAULT 0, retryAfter REAL) WITHOUT ROWID")
+            seedRows = [(entry.name[:-4], imageCached, entry.stat().st_size, None, 0, None) for entry in os.scandir(self.cacheDir)
+                                                                                            if entry.name.endswith('.jpg')]
+            try:
+                retryAfter = time.time() + imageMissingExpiry
+                with open(self.failedFile, 'r') as failedParts:
+                    seedRows += [(line[:-4], imageFailed, 0, imageMissing, 1, retryAfter) for line in failedParts.read().splitlines()
+                                                                                          if line.endswith('.jpg')]
+            except OSError:
+                pass
+            # An image in the directory wins over an old failure
+            cur.executemany("INSERT OR IGNORE INTO images (LCSCPart, status, originalBytes, reason, attempts, retryAfter) "
+                            "VALUES (?,?,?,?,?,?)", seedRows)
+            self.con.commit()
+        else:
+            cur.execute("PRAGMA table_info(images)")
+            columns = [column[1] for column in cur.fetchall()]
+            cur.execute("BEGIN")
+            if 'originalBytes' not in columns:
+                # Index made before there were thumbnails, size up the images it already has
+                cur.execute("ALTER TABLE images ADD COLUMN originalBytes INTEGER DEFAULT 0")
+                cur.execute("SELECT LCSCPart FROM images WHERE status = ?", (imageCached,))
+                sizes = []
+                for (lcscPart,) in cur.fetchall():
+                    try:
+                        sizes.append((os.path.getsize(self.cacheDir + lcscPart + '.jpg'), lcscPart))
+                    except OSError:
+                        pass
+                cur.executemany("UPDATE images SET originalBytes = ? WHERE LCSCPart = ?", sizes)
+            if 'retryAfter' not in columns:
+                # Index made when failures were forever, treat them all as missing images
+                for column in ['reason TEXT', 'attempts INTEGER DEFAULT 0', 'retryAfter REAL']:
+                    cur.execute("ALTER TABLE images ADD COLUMN " + column)
+                cur.execute("UPDATE images SET reason = ?, attempts = 1, retryAfter = ? WHERE status = ?",
+                            (imageMissing, time.time() + imageMissingExpiry, imageFailed))
+            self.con.commit()
+        cur.execute("SELECT TOTAL(originalBytes) FROM images")
+        self.originalBytes = cur.fetchone()[0]
+        cur.execute("SELECT LCSCPart, retryAfter FROM images WHERE status = ?", (imageFailed,))
+        self.retryTimes = dict(cur.fetchall())
+        cur.execute("SELECT template, COUNT(*) FROM images WHERE status = ? AND template IS NOT NULL GROUP BY template", (imageCached,))
+        self.templateHits = collections.Counter(dict(cur.fetchall()))
+        cur.execute("SELECT LCSCPart, status FROM images")
+        self.statuses = dict(cur.fetchall())
+
+    def status(self, lcscPart):
+        # imageCached, imageFailed or None if it's never been tried or is due another try
+        with self.lock:
+            self.load()
+            status = self.statuses.get(lcscPart)
+            if status == imageFailed and self.retryTimes.get(lcscPart, 0) <= time.time():
+                return None
+            return status
+
+    def templateWaves(self):
+        '''
+         imageUrlTemplates indices in two lists: the templates that found imageFirstWaveShare of the
+         images so far, to try first, and the rest for when those all miss. All in one list until
+         anything has been found
+        '''
+        with self.lock:
+            self.load()
+            order = sorted(range(len(imageUrlTemplates)), key=lambda templateIndex: -self.templateHits[templateIndex])
+            totalHits = sum(self.templateHits.values())
+            if totalHits == 0:
+                return [order]
+            firstWave = []
+            hits = 0
+            for templateIndex in order:
+                if hits >= imageFirstWaveShare*totalHits:
+                    break
+                firstWave.append(templateIndex)
+                hits += self.templateHits[templateIndex]
+            return [firstWave, order[len(firstWave):]]
+
+    def thumbnailFilename(self, lcscPart, size):
+        # Sharded on the end of the part number so no one directory gets huge
+        return '{0}thumbs/{1}/{2}/{3}.jpg'.format(self.cacheDir, size, lcscPart[-2:], lcscPart)
+
+    def makeThumbnails(self, lcscPart, imageFile):
+        # Thumbnails are made with Qt, without it there's only ever the full size image
+        try:
+            from PyQt5.QtCore import Qt
+            from PyQt5.QtGui import QImage
+        except ImportError:
+            return False
+        image = QImage(imageFile)
+        if image.isNull():
+            return False
+        for size in thumbnailSizes:
+            thumbnailFile = self.thumbnailFilename(lcscPart, size)
+            os.makedirs(os.path.dirname(thumbnailFile), exist_ok=True)
+            image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation).save(thumbnailFile, 'JPG', 85)
+        return True
+
+    def thumbnail(self, lcscPart, size):
+        '''
+         Filename of a part's thumbnail (size is one of thumbnailSizes), made from the full size image
+         if it was cached before there were thumbnails. None if there's neither
+        '''
+        thumbnailFile = self.thumbnailFilename(lcscPart, size)
+        if not os.path.isfile(thumbnailFile):
+            if not self.makeThumbnails(lcscPart, self.cacheDir + lcscPart + '.jpg'):
+                return None
+        return thumbnailFile
+
+    def storeImage(self, lcscPart, image, template):
+        # A freshly downloaded image, saved along with its thumbnails
+        with open(self.cacheDir + lcscPart + '.jpg', 'wb') as imageFile:
+            imageFile.write(image)
+        self.makeThumbnails(lcscPart, self.cacheDir + lcscPart + '.jpg')
+        self.record(lcscPart, imageCached, template, len(image))
+        self.evictOriginals()
+
+    def record(self, lcscPart, status, template=None, originalBytes=0, reason=None):
+        with self.lock:
+            self.load()
+            now = time.time()
+            previous = self.con.execute("SELECT originalBytes, attempts FROM images WHERE LCSCPart = ?", (lcscPart,)).fetchone()
+            previousBytes, previousAttempts = previous if previous is not None else (0, 0)
+            self.originalBytes += originalBytes - previousBytes
+
+            attempts = 0
+            retryAfter = None
+            if status == imageFailed:
+                attempts = (previousAttempts or 0) + 1
+                if reason == imageError:
+                    retryAfter = now + min(imageErrorRetry * 2**min(attempts - 1, 20), imageErrorRetryMax)
+                else:
+                    retryAfter = now + imageMissingExpiry
+                self.retryTimes[lcscPart] = retryAfter
+            else:
+                self.retryTimes.pop(lcscPart, None)
+                if template is not None:
+                    self.templateHits[template] += 1
+            self.statuses[lcscPart] = status
+
+            self.con.execute("INSERT OR REPLACE INTO images (LCSCPart, status, template, fetched, originalBytes, reason, attempts, retryAfter) "
+                             "VALUES (?,?,?,?,?,?,?,?)", (lcscPart, status, template, now, originalBytes, reason, attempts, retryAfter))
+            self.con.commit()
+
+    def evictOriginals(self):
+        '''
+         Deletes the least recently fetched full size images until they're back under budget with a
+         bit to spare. Their thumbnails are kept so they still show everywhere
+        '''
+        with self.lock:
+            if self.originalBytes <= self.originalBudget:
+                return
+            evicted = []
+            cur = self.con.execute("SELECT LCSCPart, originalBytes FROM images WHERE originalBytes > 0 ORDER BY fetched")
+            for lcscPart, originalBytes in cur:
+                if self.originalBytes <= 0.9*self.originalBudget:
+                    break
+                # Anything cached before there were thumbnails needs them now or it's gone for good
+                if self.thumbnail(lcscPart, cellImageSize) is not None:
+                    try:
+                        os.remove(self.cacheDir + lcscPart + '.jpg')
+                    except OSError:
+                        pass
+                    self.originalBytes -= originalBytes
+                    evicted.append((lcscPart,))
+            self.con.executemany("UPDATE images SET originalBytes = 0 WHERE LCSCPart = ?", evicted)
+            self.con.commit()
+
+    def clearFailed(self, lcscPart=None):
+        # Forgets every failure, or just lcscPart's, so they're tried again straight away
+        with self.lock:
+            self.load()
+            if lcscPart is None:
+                self.con.execute("DELETE FROM images WHERE status = ?", (imageFailed,))
+                self.statuses = {part: status for part, status in self.statuses.items() if status != imageFailed}
+                self.retryTimes = {}
+            elif self.statuses.get(lcscPart) == imageFailed:
+                self.con.execute("DELETE FROM images WHERE LCSCPart = ? AND status = ?", (lcscPart, imageFailed))
+                del self.statuses[lcscPart]
+                self.retryTimes.pop(lcscPart, None)
+            self.con.commit()
+
+    def count(self):
+        with self.lock:
+            self.load()
+            return len(self.statuses)
+
+
+sharedImageCache = None
+sharedImageCacheLock = threading.Lock()
+
+def getImageCache():
+    # Everything shares one ImageCache so they all see each other's downloads
+    global sharedImageCache
+    with sharedImageCacheLock:
+        if sharedImageCache is None:
+            sharedImageCache = ImageCache()
+    return sharedImageCache
+
+
+class ImageFetcher:
+    '''
+     Downloads part images into the image cache over one keep-alive session.
+     The URL templates that have found most images so far are tried at once, then the rest if they
+     all miss, and fetchMany() works on several parts at once, never with more than maxConcurrency
+     requests in flight. Every result goes in imageCache.
+     urlBase is there so it can be pointed at a local server for testing
+    '''
+    def __init__(self, maxConcurrency=imageFetchConcurrency, urlBase=imageUrlBase, imageCache=None):
+        self.maxConcurrency = maxConcurrency
+        self.urlBase = urlBase
+        self.imageCache = imageCache if imageCache is not None else getImageCache()
+
+        # Only needed once there's something to download
+        import requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=maxConcurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Separate pools so a part waiting on its probes can never starve the probes themselves
+        self.probeExecutor = ThreadPoolExecutor(maxConcurrency, thread_name_prefix='imageProbe')
+        self.partExecutor = ThreadPoolExecutor(maxConcurrency, thread_name_prefix='imageFetch')
+        self.countLock = threading.Lock()
+        self.probeCount = 0
+        self.fetchCount = 0
+
+    def probe(self, url):
+        # (image, None) if it's at this url, otherwise (None, imageMissing or imageError)
+        import requests
+        print('.', end='', flush=True)
+        with self.countLock:
+            self.probeCount += 1
+        startTime = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=3.05)
+            phaseTimings.record('image.request', time.perf_counter() - startTime, '{0} {1}'.format(response.status_code, url))
+            if response.status_code == 200:
+                return response.content, None
+            if response.status_code in (403, 404, 410):
+                return None, imageMissing
+        except requests.RequestException as err:
+            phaseTimings.record('image.request', time.perf_counter() - startTime, '{0} {1}'.format(type(err).__name__, url))
+            print('html request threw exception: {0}'.format(err))
+        return None, imageError
+
+    def requestsPerImage(self):
+        with self.countLock:
+            return self.probeCount / max(self.fetchCount, 1)
+
+    def fetch(self, row):
+        # Returns the image filename, or defaultImage if it couldn't be found
+        startTime = time.perf_counter()
+        imageFilename = self.download(row)
+        phaseTimings.record('image.download', time.perf_counter() - startTime,
+                            '{0} {1}'.format(row[DbRowEnum.DB_ROW_LCSC_PART], 'found' if imageFilename != defaultImage else 'not found'))
+        return imageFilename
+
+    def download(self, row):
+        lcscPart = row[DbRowEnum.DB_ROW_LCSC_PART]
+        partialImageName = imageUrlName(row)
+        if partialImageName is None:
+            return defaultImage
+    
+        global numFetchedImages
+        numFetchedImages += 1
+        with self.countLock:
+            self.fetchCount += 1
+
+        image = None
+        reasons = set()
+        for wave in self.imageCache.templateWaves():
+            probes = {}
+            for templateIndex in wave:
+                url = imageUrlTemplates[templateIndex].format(base=self.urlBase, name=partialImageName)
+                probes[self.probeExecutor.submit(self.probe, url)] = templateIndex
+
+            # First one back with an image wins, any still waiting to start are dropped
+            for probe in as_completed(probes):
+                image, reason = probe.result()
+                if image is not None:
+                    templateIndex = probes[probe]
+                    print('{0}'.format(templateIndex), end='', flush=True)
+                    break
+                reasons.add(reason)
+            for probe in probes:
+                probe.cancel()
+            if image is not None:
+                break
+                  
+        if image is None:
+            # A failed retry doesn't lose an image that's already cached. If anything went wrong
+            # rather than simply not being there, it's tried again sooner
+            if self.imageCache.status(lcscPart) != imageCached:
+                reason = imageError if imageError in reasons else imageMissing
+                self.imageCache.record(lcscPart, imageFailed, reason=reason)
+            return defaultImage
+
+        self.imageCache.storeImage(lcscPart, image, templateIndex)
+        return lcscPart + '.jpg'
+
+    def fetchMany(self, rows, cancelled=None):
+        '''
+         Generates (row, image filename) for each row as its fetch finishes. Only a couple of parts per
+         connection are queued at a time so a huge list of rows doesn't all sit in memory, and once
+         cancelled is set no more are started
+        '''
+        rows = iter(rows)
+        pending = set()
+        rowsLeft = True
+        while True:
+            while rowsLeft and len(pending) < 2*self.maxConcurrency and not (cancelled is not None and cancelled.is_set()):
+                row = next(rows, None)
+                if row is None:
+                    rowsLeft = False
+                else:
+                    fetch = self.partExecutor.submit(self.fetch, row)
+                    fetch.row = row
+                    pending.add(fetch)
+            if len(pending) == 0:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fetch in done:
+                yield fetch.row, fetch.result()
+
+
+sharedImageFetcher = None
+sharedImageFetcherLock = threading.Lock()
+
+def getimageFilename(row):
+    # Fetch one image with the fetcher shared by the search and BOM tabs
+    global sharedImageFetcher
+    with sharedImageFetcherLock:
+        if sharedImageFetcher is None:
+            sharedImageFetcher = ImageFetcher()
+    return sharedImageFetcher.fetch(row)
+
+# The CSV is GBK but is read as ISO8859, so each GBK character outside ASCII arrives as a pair of odd
+# characters. These are the ones with a plain spelling, the rest become what they should have been
+oddCharReplacements = {u'\u03bc': 'u',   # micro
+                       u'\u03a9': 'R',   # Ohms
+                       u'\u00b1': '+/-', # Plus or minus
+                       u'\u2103': 'C',   # Celcius
+                       u'\uff05': '%'    # Percent
+                       }
+oddCharPattern = re.compile(u'[\x81-\xfe][\x40-\x7e\x80-\xfe]')
+oddCharFixes = {}
+
+def fixOddChar(match):
+    # Each pair is only decoded the first time it's seen
+    oddChars = match.group(0)
+    fixed = oddCharFixes.get(oddChars)
+    if fixed is None:
+        try:
+            fixed = oddChars.encode('ISO8859').decode('gbk')
+        except UnicodeDecodeError:
+            fixed = oddChars
+        else:
+            # Full width letters, digits and punctuation become the ordinary ones
+            fixed = oddCharReplacements.get(fixed) or unicodedata.normalize('NFKC', fixed)
+        oddCharFixes[oddChars] = fixed
+    return fixed
+
+def fixUpOddChars(rawString):
+    # Most text is plain ASCII with nothing to fix
+    if rawString.isascii():
+        return rawString
+    return oddCharPattern.sub(fixOddChar, rawString)
+
+class ProgressTextFile:
+    '''
+     Text view of a file opened in binary mode that can say how far through the file it has got,
+     so progress can be worked out without counting the lines first
+    '''
+    def __init__(self, rawFile, encoding):
+        self.rawFile = rawFile
+        self.textFile = io.TextIOWrapper(rawFile, encoding=encoding, newline='')
+        self.fileSize = max(os.fstat(rawFile.fileno()).st_size, 1)
+
+    def __iter__(self):
+        return iter(self.textFile)
+
+    def progress(self):
+        # Out of 10000 to suit the progress bar, the text layer reads ahead by a few KB at most
+        return min(int((self.rawFile.tell()*10000)/self.fileSize), 10000)
+
+    def estimatedTotal(self, rowsSoFar):
+        # Assume the rest of the file has the same sort of rows as the part already read
+        bytesRead = self.rawFile.tell()
+        if bytesRead == 0:
+            return rowsSoFar
+        return int(rowsSoFar*self.fileSize/bytesRead)
+
+
+class ChunkProgress:
+    '''
+     The same as ProgressTextFile's progress for a file that's being read in chunks elsewhere,
+     bytesDone is how far the chunks that have been used so far go
+    '''
+    def __init__(self, fileSize):
+        self.fileSize = max(fileSize, 1)
+        self.bytesDone = 0
+
+    def progress(self):
+        return min(int((self.bytesDone*10000)/self.fileSize), 10000)
+
+    def estimatedTotal(self, rowsSoFar):
+        if self.bytesDone == 0:
+            return rowsSoFar
+        return int(rowsSoFar*self.fileSize/self.bytesDone)
+
+def convertCsvRows(reader, knownHashes=None, seenParts=None, cancelled=None, timings=None):
+    '''
+     Normalised database rows, with their price break and value rows, from the CSV. When updating, rows whose
+     hash matches the one already in the database come through as None, so whoever is reading them
+     can keep up with how far through the file it's got, and every part in the file is added to
+     seenParts. The time spent fixing up text is added to timings['textSeconds']
+    '''
+    for row in reader:
+        # Abort mechanism
+        if cancelled is not None and cancelled.is_set():
+            return
+
+        imageFilename = ''
+        
+        # The first line in JLC files is a header
+        if len(row) == 13:
+            contentHash = rowContentHash(row)
+            if knownHashes is not None:
+                seenParts.add(row[DbRowEnum.DB_ROW_LCSC_PART])
+                if knownHashes.get(row[DbRowEnum.DB_ROW_LCSC_PART]) == contentHash:
+                    yield None
+                    continue
+
+            # Boil down lists of prices to be just the highest price (usually lowest number)
+            priceBreaks = parsePriceBreaks(row[DbRowEnum.DB_ROW_PRICE])
+            worstPrice = max(unitPrice for minQty, maxQty, unitPrice in priceBreaks)
+            minQuantity = max(min(minQty for minQty, maxQty, unitPrice in priceBreaks), 1)
+                        
+            row[DbRowEnum.DB_ROW_WORST_PRICE] = worstPrice * minQuantity
+            try:
+                row[DbRowEnum.DB_ROW_STOCK] = int(row[DbRowEnum.DB_ROW_STOCK])
+            except ValueError:
+                row[DbRowEnum.DB_ROW_STOCK] = 0
+            textStart = time.perf_counter()
+            row[DbRowEnum.DB_ROW_FIRST_CAT] = fixUpOddChars(row[DbRowEnum.DB_ROW_FIRST_CAT])
+            row[DbRowEnum.DB_ROW_SEC_CAT] = fixUpOddChars(row[DbRowEnum.DB_ROW_SEC_CAT])
+            row[DbRowEnum.DB_ROW_DESCR] = fixUpOddChars(row[DbRowEnum.DB_ROW_DESCR])
+            if timings is not None:
+                timings['textSeconds'] += time.perf_counter() - textStart
+            row.append(minQuantity)
+            row.append(imageFilename)
+            row.append(contentHash)
+            row.append(worstPrice)
+            row.append(canonicalPackage(row[DbRowEnum.DB_ROW_PACKAGE]))
+            
+            # Nonsense prices stay out of the price table
+            priceRows = [(row[DbRowEnum.DB_ROW_LCSC_PART], minQty, maxQty, unitPrice)
+                         for minQty, maxQty, unitPrice in priceBreaks if unitPrice != unknownPrice]
+            valueRows = [(row[DbRowEnum.DB_ROW_LCSC_PART], kind, value) for kind, value in parseParameters(row[DbRowEnum.DB_ROW_DESCR])]
+            yield row, priceRows, valueRows
+
+def csvChunks(csvFilename, chunkSize):
+    '''
+     (start, end) byte offsets of pieces of the CSV about chunkSize long, each a whole number of rows.
+     A newline after an odd number of quotes is inside a quoted field, so pieces never end there
+    '''
+    with open(csvFilename, 'rb') as rawFile:
+        fileSize = os.fstat(rawFile.fileno()).st_size
+        start = 0
+        while start < fileSize:
+            size = chunkSize
+            while True:
+                rawFile.seek(start)
+                block = rawFile.read(size)
+                if start + len(block) >= fileSize:
+                    end = fileSize
+                    break
+                cut = block.rfind(b'\n')
+                while cut >= 0 and block.count(b'"', 0, cut) % 2:
+                    cut = block.rfind(b'\n', 0, cut)
+                if cut >= 0:
+                    end = start + cut + 1
+                    break
+                # No row ends in this much of the file, try more
+                size *= 2
+            yield start, end
+            start = end
+
+# The database's part hashes when updating, set in each conversion process as it starts
+convertKnownHashes = None
+
+def startConvertProcess(knownHashes):
+    global convertKnownHashes
+    convertKnownHashes = knownHashes
+
+def convertCsvChunk(csvFilename, start, end):
+    '''
+     convertCsvRows for the rows between two byte offsets of the CSV, run in a conversion process.
+     Returns a list of the rows, the set of parts seen (None unless updating) and the seconds spent
+     fixing up text
+    '''
+    with open(csvFilename, 'rb') as rawFile:
+        rawFile.seek(start)
+        text = rawFile.read(end - start).decode('ISO8859')
+    seenParts = set() if convertKnownHashes is not None else None
+    reader = csv.reader(io.StringIO(text, newline=''), delimiter=',')
+    timings = {'textSeconds': 0.0}
+    rows = [row for row in convertCsvRows(reader, convertKnownHashes, seenParts, timings=timings) if row is not None]
+    return rows, seenParts, timings['textSeconds']
+
+
+class Converter:
+    '''
+     Converts the JLC CSV file into the database.
+     Rows are inserted insertBatchSize at a time, progress(rows converted, estimated rows in the file,
+     progress out of 10000) is called after each batch (and every progressInterval seconds when an update
+     has nothing to write) and status(message) as it goes on, and cancel()
+     (from any thread) stops it before the next row.
+     With updateExisting set (and a database of the current schema to update) only the parts whose
+     CSV row has changed are written and parts no longer in the CSV are removed, all in one
+     transaction so the database can still be searched while it happens
+    '''
+    insertBatchSize = 5000
+    progressInterval = 0.2
+
+    def __init__(self, csvFilename, dbFilename, cacheAllImages, imageCache, updateExisting=False,
+                 imageConcurrency=imageFetchConcurrency, progress=None, status=None, processes=importProcesses):
+        self.csvFilename = csvFilename
+        self.dbFilename = dbFilename
+        self.cacheAllImages = cacheAllImages
+        self.imageCache = imageCache
+        self.updateExisting = updateExisting
+        self.imageConcurrency = imageConcurrency
+        self.processes = processes
+        self.cancelled = threading.Event()
+        self.stats = {}
+        self.progress = progress if progress is not None else lambda rowIndex, dbLength, progress: None
+        self.status = status if status is not None else lambda message: None
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def readCsv(self, rawFile, knownHashes=None, seenParts=None):
+        '''
+         The converted rows from the CSV and something that can say how far through it they've got.
+         Files big enough to be worth it are split up and converted on self.processes processes
+        '''
+        fileSize = os.fstat(rawFile.fileno()).st_size
+        self.stats['textSeconds'] = 0.0
+        if self.processes > 1 and fileSize > 2*importChunkSize:
+            self.stats['processes'] = self.processes
+            csvFile = ChunkProgress(fileSize)
+            return self.convertedChunks(csvFile, knownHashes, seenParts), csvFile
+        self.stats['processes'] = 1
+        csvFile = ProgressTextFile(rawFile, 'ISO8859')
+        reader = csv.reader(csvFile,delimiter=',')
+        return convertCsvRows(reader, knownHashes, seenParts, self.cancelled, self.stats), csvFile
+
+    def convertedChunks(self, csvFile, knownHashes, seenParts):
+        '''
+         Rows converted by convertCsvChunk in a pool of processes, in the order they're in the file.
+         Only a couple of chunks per process are asked for ahead of the writer so the rows waiting
+         to be written don't fill up memory
+        '''
+        # Spawned rather than forked, forking a process with Qt threads running isn't safe
+        pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=startConvertProcess, initargs=(knownHashes,))
+        chunks = csvChunks(self.csvFilename, importChunkSize)
+        pending = collections.deque()
+        try:
+            while True:
+                for start, end in itertools.islice(chunks, 2*self.processes - len(pending)):
+                    pending.append((end, pool.submit(convertCsvChunk, self.csvFilename, start, end)))
+                if len(pending) == 0:
+                    return
+                end, converted = pending.popleft()
+                rows, chunkParts, textSeconds = converted.result()
+                self.stats['textSeconds'] += textSeconds
+                if seenParts is not None:
+                    seenParts.update(chunkParts)
+                csvFile.bytesDone = end
+                # Even a chunk with nothing to write has moved things on
+                yield None
+                for row in rows:
+                    if self.cancelled.is_set():
+                        return
+                    yield row
+        finally:
+            # When aborting, the chunks being converted are left to finish on their own
+            pool.shutdown(wait=not self.cancelled.is_set(), cancel_futures=True)
+
+    def loadRows(self, cur, sqlCommand, rows, csvFile, replacePrices):
+        '''
+         Write the rows with their price breaks and values in batches, returns how many parts were written.
+         When the parts are already in the database their old price breaks and values are removed first.
+         Rows that are None (unchanged parts when updating) aren't written, but still keep progress moving
+        '''
+        rowIndex = 0
+        batch = []
+        lastProgress = time.perf_counter()
+        for row in rows:
+            if row is not None:
+                batch.append(row)
+                if len(batch) < self.insertBatchSize:
+                    continue
+                self.writeBatch(cur, sqlCommand, batch, replacePrices)
+                rowIndex += len(batch)
+                batch = []
+            elif time.perf_counter() - lastProgress < self.progressInterval:
+                continue
+            self.progress(rowIndex, csvFile.estimatedTotal(rowIndex), csvFile.progress())
+            lastProgress = time.perf_counter()
+        if len(batch) > 0:
+            self.writeBatch(cur, sqlCommand, batch, replacePrices)
+            rowIndex += len(batch)
+        self.progress(rowIndex, csvFile.estimatedTotal(rowIndex), csvFile.progress())
+        return rowIndex
+
+    def writeBatch(self, cur, sqlCommand, batch, replacePrices):
+        cur.executemany(sqlCommand, (row for row, priceRows, valueRows in batch))
+        if replacePrices:
+            cur.executemany("DELETE FROM jlcPrice WHERE LCSCPart = ?", ([row[DbRowEnum.DB_ROW_LCSC_PART]] for row, priceRows, valueRows in batch))
+            cur.executemany("DELETE FROM jlcValue WHERE LCSCPart = ?", ([row[DbRowEnum.DB_ROW_LCSC_PART]] for row, priceRows, valueRows in batch))
+        cur.executemany("INSERT OR REPLACE INTO jlcPrice VALUES (?,?,?,?)", (priceRow for row, priceRows, valueRows in batch for priceRow in priceRows))
+        cur.executemany("INSERT OR IGNORE INTO jlcValue VALUES (?,?,?)", (valueRow for row, priceRows, valueRows in batch for valueRow in valueRows))
+
+    def rebuildDatabase(self):
+        # Built under another name and only swapped in once it's finished, so giving up part way
+        # leaves the database that was there before
+        newFilename = self.dbFilename + '.new'
+        removeDatabaseFiles(newFilename)
+        
+        con = sqlite3.connect(newFilename)
+        cur = con.cursor()
+        setBulkLoadPragmas(cur)
+        
+        # Create table
+        cur.execute('''CREATE TABLE jlc
+                       (LCSCPart TEXT PRIMARY KEY, FirstCategory TEXT, SecondCategory TEXT, MFRPart TEXT, Package TEXT, SolderJoint TEXT,
+                        Manufacturer TEXT, LibraryType TEXT, Description TEXT, Datasheet TEXT, Price TEXT, Stock INTEGER,
+                        worstPrice REAL, minQuantity INTEGER, image TEXT, contentHash TEXT, unitPrice REAL, canonicalPackage TEXT)''')
+        
+        # One row per price break, maxQty is openEndedQuantity for the last break
+        cur.execute('''CREATE TABLE jlcPrice
+                       (LCSCPart TEXT, minQty INTEGER, maxQty INTEGER, unitPrice REAL, PRIMARY KEY (LCSCPart, minQty)) WITHOUT ROWID''')
+        
+        # One row per value in the description, kind is one of parameterKinds
+        cur.execute('''CREATE TABLE jlcValue
+                       (LCSCPart TEXT, kind TEXT, value REAL, PRIMARY KEY (LCSCPart, kind, value)) WITHOUT ROWID''')
+        
+        # The file is only read once, progress comes from how far through the file we are
+        with open(self.csvFilename, 'rb') as rawFile:
+            rows, csvFile = self.readCsv(rawFile)
+            rowCount = self.loadRows(cur, "INSERT OR REPLACE INTO jlc VALUES ({0})".format(','.join('?'*len(jlcColumns))),
+                                     rows, csvFile, False)
+        self.stats['rows'] = rowCount
+        self.stats['loadSeconds'] = round(time.perf_counter() - self.startTime, 3)
+        
+        # Indexes are much quicker to build in one go than to keep up to date row by row
+        completed = not self.cancelled.is_set()
+        if completed:
+            self.status("Building indexes")
+            createIndexes(cur)
+            con.commit()
+                    
+        # Closing without committing just drops an aborted build, it's thrown away anyway
+        con.close()
+        if completed:
+            # Including any write-ahead log left behind by a conversion that died
+            try:
+                removeDatabaseFiles(self.dbFilename)
+                os.replace(newFilename, self.dbFilename)
+            except OSError as error:
+                # Most likely something else still has it open
+                self.status("Can't replace {0} ({1}), the new database is in {2}".format(self.dbFilename, error, newFilename))
+                completed = False
+        else:
+            removeDatabaseFiles(newFilename)
+        return completed
+
+    def updateDatabase(self):
+        con = sqlite3.connect(self.dbFilename)
+        cur = con.cursor()
+        cur.execute("PRAGMA cache_size = -262144")   # 256MB
+        
+        cur.execute("SELECT LCSCPart, contentHash FROM jlc")
+        knownHashes = dict(cur.fetchall())
+        seenParts = set()
+
+        upsertCommand = "INSERT INTO jlc VALUES ({0}) ON CONFLICT(LCSCPart) DO UPDATE SET {1}".format(
+                            ','.join('?'*len(jlcColumns)),
+                            ', '.join('{0}=excluded.{0}'.format(column) for column in jlcColumns[1:]))
+
+        # Everything happens in one transaction, searches carry on seeing the old data until it's committed
+        with open(self.csvFilename, 'rb') as rawFile:
+            rows, csvFile = self.readCsv(rawFile, knownHashes, seenParts)
+            changedCount = self.loadRows(cur, upsertCommand, rows, csvFile, True)
+        self.stats['rows'] = len(seenParts)
+        self.stats['changed'] = changedCount
+        self.stats['loadSeconds'] = round(time.perf_counter() - self.startTime, 3)
+
+        completed = not self.cancelled.is_set()
+        if completed:
+            self.status("Removing discontinued parts")
+            vanishedParts = knownHashes.keys() - seenParts
+            cur.executemany("DELETE FROM jlc WHERE LCSCPart = ?", ([part] for part in vanishedParts))
+            cur.executemany("DELETE FROM jlcPrice WHERE LCSCPart = ?", ([part] for part in vanishedParts))
+            cur.executemany("DELETE FROM jlcValue WHERE LCSCPart = ?", ([part] for part in vanishedParts))
+            self.stats['removed'] = len(vanishedParts)
+            con.commit()
+        else:
+            con.rollback()
+        con.close()
+        return completed
+
+    def run(self):
+        self.startTime = time.perf_counter()
+        self.stats = {}
+        if self.updateExisting and databaseSchemaVersion(self.dbFilename) == dbSchemaVersion:
+            completed = self.updateDatabase()
+        else:
+            completed = self.rebuildDatabase()
+        totalTime = time.perf_counter() - self.startTime
+        phaseTimings.record('convert', totalTime, self.csvFilename)
+
+        self.stats['indexSeconds'] = round(totalTime - self.stats['loadSeconds'], 3)
+        self.stats['totalSeconds'] = round(totalTime, 3)
+        self.stats['rowsPerSecond'] = int(self.stats['rows'] / max(totalTime, 1e-6))
+        self.stats['textSeconds'] = round(self.stats['textSeconds'], 3)
+        # Through status like everything else, so whatever is running the conversion decides where it goes
+        self.status('Converted {rows} rows in {totalSeconds}s ({loadSeconds}s loading, {indexSeconds}s indexing): {rowsPerSecond} rows/sec on {processes} process(es)'.format(**self.stats))
+        # Added up over all the processes, so it can be more than the time spent loading
+        self.status('Fixing up text took {textSeconds}s'.format(**self.stats))
+        if 'changed' in self.stats and completed:
+            self.status("Done: {changed} parts changed, {removed} removed".format(**self.stats))
+        elif completed:
+            self.status("Done: {rowsPerSecond} rows/sec".format(**self.stats))
+
+        # The database is complete and usable by now, the images can take as long as they take
+        if completed and self.cacheAllImages:
+            completed = self.cacheImages()
+        return completed
+
+    def cacheImages(self):
+        self.status("Caching images")
+        con = sqlite3.connect(self.dbFilename)
+        try:
+            partCount = con.execute("SELECT COUNT(*) FROM jlc").fetchone()[0]
+            self.imageRowsScanned = 0
+            fetcher = ImageFetcher(self.imageConcurrency, imageCache=self.imageCache)
+            imageIndex = 0
+            for row, imageFilename in fetcher.fetchMany(self.uncachedImageRows(con.cursor()), self.cancelled):
+                imageIndex += 1
+                if imageIndex % 10 == 0:
+                    self.progress(imageIndex, partCount, int((self.imageRowsScanned*10000)/max(partCount, 1)))
+        finally:
+            con.close()
+        
+        completed = not self.cancelled.is_set()
+        if completed:
+            self.status("Done: images cached, {0:.1f} requests per image".format(fetcher.requestsPerImage()))
+        return completed
+
+    def uncachedImageRows(self, cur):
+        '''
+         Rows with just the columns imageUrlName() needs, for the parts that have no image cached and
+         aren't waiting for a retry. They're read from the cursor as the fetcher wants them rather than
+         all at once, and imageRowsScanned counts every part looked at so far
+        '''
+        cur.execute("SELECT {0} FROM jlc".format(', '.join(jlcColumns[column] for column in imageNameColumns)))
+        for values in cur:
+            self.imageRowsScanned += 1
+            if self.imageCache.status(values[0]) is not None:
+                continue
+            row = [''] * len(DbRowEnum)
+            for column, value in zip(imageNameColumns, values):
+                row[column] = value
+            yield row
+
+
+class BomMatcher:
+    '''
+     Finds the best part for each BOM line on a pool of threads, each with its own read only
+     connection so they can all be querying at once, and passes each to matched(BOM line index,
+     jlc row or None if nothing matched) as soon as it's found. Lines that are the same are only
+     matched once
+    '''
+    def __init__(self, dbFilename, lines, useExtended, numThreads=bomMatchThreads, matched=None):
+        self.dbFilename = dbFilename
+        self.lines = lines                # (comment, footprint) for each row
+        self.useExtended = useExtended
+        self.numThreads = numThreads
+        self.cancelled = threading.Event()
+        self.resolvers = threading.local()
+        self.matched = matched if matched is not None else lambda rowIndex, row: None
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def match(self, line, openResolvers):
+        if self.cancelled.is_set():
+            return None
+        resolver = getattr(self.resolvers, 'resolver', None)
+        if resolver is None:
+            resolver = self.resolvers.resolver = BomResolver(self.dbFilename, readOnly=True)
+            openResolvers.append(resolver)
+        startTime = time.perf_counter()
+        row = resolver.bestMatch(line[0], line[1], self.useExtended)
+        phaseTimings.record('bom.line', time.perf_counter() - startTime, '{0} {1}'.format(*line))
+        return row
+
+    def run(self):
+        startTime = time.perf_counter()
+        rowsForLine = {}
+        for rowIndex, line in enumerate(self.lines):
+            rowsForLine.setdefault(line, []).append(rowIndex)
+
+        openResolvers = []
+        executor = ThreadPoolExecutor(self.numThreads, thread_name_prefix='bomMatch')
+        matches = {executor.submit(self.match, line, openResolvers): line for line in rowsForLine}
+        try:
+            for match in as_completed(matches):
+                if self.cancelled.is_set():
+                    break
+                for rowIndex in rowsForLine[matches[match]]:
+                    self.matched(rowIndex, match.result())
+        finally:
+            # Also when a match raised, which is passed on once the connections are closed
+            for match in matches:
+                match.cancel()
+            executor.shutdown()
+            for resolver in openResolvers:
+                resolver.close()
+        phaseTimings.record('bom.match', time.perf_counter() - startTime, '{0} lines'.format(len(self.lines)))
+        return not self.cancelled.is_set()
+
+
+class PartSearcher:
+    '''
+     Searches the database the way the Search tab does, remembering recent searches in a SearchCache.
+     Every search opens a new connection, so a database that's been converted again is picked up.
+     The SQL the last search ran is kept in queries, {kind of query: (SQL, parameters)}
+    '''
+    def __init__(self, dbFilename):
+        self.dbFilename = dbFilename
+        self.con = None
+        self.searchCache = SearchCache()
+        self.queries = collections.OrderedDict()
+        self.lastSearch = None            # What the last search was for and how it was found
+
+    def search(self, keyWordList, packagesList, useExtended, sortValue, quantity):
+        '''
+         A pager (SearchPager or PartListPager) for the parts with all the keywords in any of the
+         packages, in sortValue (a SortEnum) order. A keyword that's an LCSC part number on its own
+         just looks up that part. No keywords finds nothing rather than the whole catalogue
+        '''
+        startTime = time.perf_counter()
+        self.con = sqlite3.connect(self.dbFilename)
+        self.queries = collections.OrderedDict()
+        cur = self.con.cursor()
+        useFts = hasFtsIndex(cur)
+
+        keyWordList = [keyWord for keyWord in keyWordList if keyWord.strip() != '']
+        if len(keyWordList) == 0:
+            self.lastSearch = None
+            return PartListPager([], self.readRows)
+
+        firstKeyword = keyWordList[0].upper()
+        partNumber = len(keyWordList) == 1 and firstKeyword[0] == 'C' and firstKeyword[1:].isnumeric()
+
+        # Part numbers are quick enough to look up that they aren't worth caching
+        searchKey = SearchCache.searchKey(self.dbFilename, keyWordList, packagesList, useExtended, sortValue, quantity)
+        parts = None if partNumber else self.searchCache.get(searchKey)
+        superset = None if partNumber or parts is not None else self.searchCache.superset(searchKey)
+        if parts is not None:
+            howFound = 'in the search cache'
+        elif superset is not None:
+            howFound = 'narrowed down from a cached search'
+            parts = self.narrowSearch(cur, useFts, keyWordList, packagesList, useExtended, searchKey, superset)
+            self.searchCache.put(searchKey, parts)
+        else:
+            howFound = 'searched for'
+            pager = self.searchPager(cur, useFts, keyWordList, packagesList, useExtended, sortValue, quantity, partNumber)
+            # Small enough results are worth keeping, big ones are only read as far as they're looked at
+            if not partNumber and pager.count() <= searchCacheLimit:
+                parts = pager.allParts()
+                self.searchCache.put(searchKey, parts)
+
+        if parts is not None:
+            pager = PartListPager(parts, self.readRows)
+        self.lastSearch = '{0} ({1})'.format(' '.join(keyWordList + packagesList), howFound)
+        phaseTimings.record('search', time.perf_counter() - startTime, self.lastSearch)
+        return pager
+
+    def searchConditions(self, cur, useFts, keyWordList, packagesList, useExtended, partNumber=False, valueIndex=True):
+        # The SQL conditions (and parameters) for the keywords, packages and library type. valueIndex is for keywordCondition
+        conditions = []
+        params = []
+        if not useExtended:
+            conditions.append("LibraryType='Basic'")
+        if partNumber:
+            conditions.append("jlc.LCSCPart = ?")
+            params.append(keyWordList[0].upper())
+        else:
+            keywordSql, keywordParams = keywordCondition(keyWordList, searchColumns, useFts, valueIndex=valueIndex)
+            if keywordSql != '':
+                conditions.append(keywordSql)
+                params += keywordParams
+        if len(packagesList) > 0:
+            packageSql, packageParams = packageCondition(cur, packagesList, useFts)
+            if packageSql != '':
+                conditions.append(packageSql)
+                params += packageParams
+        return conditions, params
+
+    def searchPager(self, cur, useFts, keyWordList, packagesList, useExtended, sortValue, quantity, partNumber):
+        # A SearchPager for a search from scratch
+        conditions, params = self.searchConditions(cur, useFts, keyWordList, packagesList, useExtended, partNumber)
+        if quantity > 1:
+            # Use the price break for the quantity wanted, parts that can't be bought in that quantity drop out
+            fromClause = "jlc JOIN jlcPrice ON jlcPrice.LCSCPart = jlc.LCSCPart AND ? BETWEEN jlcPrice.minQty AND jlcPrice.maxQty"
+            fromParams = [quantity]
+            priceColumn = 'jlcPrice.unitPrice'
+        else:
+            fromClause = "jlc"
+            fromParams = []
+            priceColumn = 'jlc.unitPrice'
+
+        # In stock means there's enough stock for the quantity wanted
+        if sortValue in (SortEnum.SORT_STOCK_DOWN, SortEnum.SORT_IN_STOCK_PRICE_UP):
+            conditions.append("jlc.Stock >= ?")
+            params.append(quantity)
+
+        # The rowid makes the order unique, so pages can carry on from where the last one stopped
+        if sortValue == SortEnum.SORT_STOCK_DOWN:
+            sortColumns = [('jlc.LibraryType', False), ('jlc.Stock', True), ('jlc.rowid', False)]
+        else:
+            sortColumns = [('jlc.LibraryType', False), (priceColumn, False), ('jlc.rowid', False)]
+        return SearchPager(self.con, fromClause, fromParams, conditions, params, sortColumns, self.queries)
+
+    def narrowSearch(self, cur, useFts, keyWordList, packagesList, useExtended, searchKey, superset):
+        '''
+         The part numbers a search that narrows a cached one finds, in order. It's only run over the
+         parts that one found, and only has to check what's changed
+        '''
+        cachedKey, cachedParts = superset
+        newKeywords = [keyWord for keyWord in keyWordList if keyWord not in cachedKey.keyWords]
+        newPackages = packagesList if searchKey.packages != cachedKey.packages else []
+        # Only the cached parts are checked, so there's nothing to gain from looking values up in the index
+        conditions, params = self.searchConditions(cur, useFts, newKeywords, newPackages, useExtended, valueIndex=False)
+
+        # The cached search already has the order, the quantity and the stock check right
+        cur.execute("CREATE TEMP TABLE searchSuperset (position INTEGER PRIMARY KEY, LCSCPart TEXT)")
+        cur.executemany("INSERT INTO searchSuperset (LCSCPart) VALUES (?)", ((part,) for part in cachedParts))
+        # Checking each cached part in turn, a join has SQLite scan the whole of jlc for a bloom filter
+        sqlCommand = "SELECT LCSCPart FROM temp.searchSuperset "
+        if len(conditions) > 0:
+            sqlCommand += "WHERE EXISTS (SELECT 1 FROM jlc WHERE jlc.LCSCPart = searchSuperset.LCSCPart AND {0}) ".format(' AND '.join(conditions))
+        sqlCommand += "ORDER BY position"
+        # Explained now, the table it needs is about to go
+        self.queries['narrow'] = (sqlCommand, params, queryPlan(cur, sqlCommand, params))
+        cur.execute(sqlCommand, params)
+        parts = [row[0] for row in cur.fetchall()]
+        cur.execute("DROP TABLE temp.searchSuperset")
+        return parts
+
+    def readRows(self, parts):
+        # The rows for some of the search results, as the table scrolls down to them
+        startTime = time.perf_counter()
+        found = partRows(self.con.cursor(), parts)
+        phaseTimings.record('sql.readRows', time.perf_counter() - startTime, '{0} rows'.format(len(found)))
+        return [found[part] for part in parts if part in found]
+
+    def explain(self):
+        # The SQL the last search ran, each with SQLite's plan for it
+        if self.lastSearch is None:
+            return ''
+        lines = [self.lastSearch, '']
+        for kind, query in self.queries.items():
+            sqlCommand, params = query[:2]
+            plan = query[2] if len(query) > 2 else queryPlan(self.con.cursor(), sqlCommand, params)
+            lines += ['{0}: {1}'.format(kind, sqlCommand), '  parameters: {0}'.format(params)] + plan + ['']
+        return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert the JLC parts CSV into a database, search it and find parts for BOMs')
+    parser.add_argument('--db', default=defaultDbFile, help='database file (default: %(default)s)')
+    parser.add_argument('--timings', action='store_true', help='show how long each phase took at the end')
+    parser.add_argument('--timing-log', metavar='FILE', help='write every phase timing to this file as it happens')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    convertParser = commands.add_parser('convert', help='convert the CSV file from JLC into the database')
+    convertParser.add_argument('csv')
+    convertParser.add_argument('--update', action='store_true', help='only write the parts that have changed')
+    convertParser.add_argument('--cache-images', action='store_true', help='then download every image (takes hours)')
+    convertParser.add_argument('--image-concurrency', type=int, default=imageFetchConcurrency, help='parallel image downloads')
+    convertParser.add_argument('--processes', type=int, default=importProcesses, help='processes converting rows (default: %(default)s)')
+
+    searchParser = commands.add_parser('search', help='list the parts with all the keywords')
+    searchParser.add_argument('keywords', nargs='+')
+    searchParser.add_argument('--packages', nargs='+', default=[], help='only parts in any of these packages')
+    searchParser.add_argument('--extended', action='store_true', help='include extended parts')
+    searchParser.add_argument('--sort', choices=sortOrders, default='stock')
+    searchParser.add_argument('--quantity', type=int, default=1, help='number of parts wanted, for prices and stock')
+    searchParser.add_argument('--limit', type=int, default=20, help='most parts to list (default: %(default)s)')
+    searchParser.add_argument('--explain', action='store_true', help='show the SQL and SQLite\'s plan for it')
+
+    bomParser = commands.add_parser('bom', help='find the best part for each line of a JLC style BOM')
+    bomParser.add_argument('bom')
+    bomParser.add_argument('--extended', action='store_true', help='include extended parts')
+    bomParser.add_argument('--out', default=defaultBomOutFile, help='BOM to write (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.timing_log:
+        phaseTimings.startLog(args.timing_log)
+    try:
+        return runCommand(args)
+    finally:
+        phaseTimings.stopLog()
+        if args.timings:
+            print(phaseTimings.report(), file=sys.stderr)
+
+def runCommand(args):
+    if args.command == 'convert':
+        if not os.path.isfile(args.csv):
+            print('Can\'t find CSV file: {0}'.format(args.csv), file=sys.stderr)
+            return 1
+        converter = Converter(args.csv, args.db, args.cache_images, getImageCache(), args.update, args.image_concurrency,
+                              status=print, processes=args.processes)
+        return 0 if converter.run() else 1
+
+    problem = databaseProblem(args.db)
+    if problem is not None:
+        print(problem, file=sys.stderr)
+        return 1
+
+    if args.command == 'search':
+        searcher = PartSearcher(args.db)
+        pager = searcher.search(args.keywords, args.packages, args.extended, sortOrders[args.sort], args.quantity)
+        print('{0} parts found'.format(pager.count()))
+        for row in pager.nextRows(args.limit):
+            print('\t'.join([row[DbRowEnum.DB_ROW_LCSC_PART], row[DbRowEnum.DB_ROW_LIB_TYPE], row[DbRowEnum.DB_ROW_PACKAGE],
+                             str(row[DbRowEnum.DB_ROW_STOCK]), row[DbRowEnum.DB_ROW_PRICE],
+                             row[DbRowEnum.DB_ROW_SEC_CAT] + ' ' + row[DbRowEnum.DB_ROW_DESCR]]))
+        if args.explain:
+            print('\n' + searcher.explain())
+        return 0
+
+    # Lines with nothing found keep the part they had
+    bom = readBom(args.bom)
+    matches = {}
+    def matched(rowIndex, row):
+        matches[rowIndex] = row
+    BomMatcher(args.db, [(line[0], line[2]) for line in bom], args.extended, matched=matched).run()
+    for rowIndex, line in enumerate(bom):
+        row = matches.get(rowIndex)
+        if row is not None:
+            line[3] = row[DbRowEnum.DB_ROW_LCSC_PART]
+        print('\t'.join(line + ['' if row is not None else 'not found']))
+    writeBom(args.out, bom)
+    print('{0} of {1} lines matched, written to {2}'.format(sum(row is not None for row in matches.values()), len(bom), args.out))
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -19,14 +19,13 @@
 ##
 #############################################################################
 
-import csv
-import sqlite3
 import os
-import requests
+import sys
 import glob
-import _thread
 import time
-import re
+import threading
+import traceback
+import collections
 
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
@@ -34,28 +33,9 @@ from PyQt5.QtGui import *
 from functools import partial
 from enum import IntEnum
 
+import jlccore
+from jlccore import *
 
-class SortEnum(IntEnum):
-    SORT_STOCK_DOWN = 1
-    SORT_PRICE_UP = 2
-    SORT_IN_STOCK_PRICE_UP = 3
-    
-class DbRowEnum(IntEnum):
-    DB_ROW_LCSC_PART = 0
-    DB_ROW_FIRST_CAT = 1
-    DB_ROW_SEC_CAT = 2
-    DB_ROW_MFR_PART = 3
-    DB_ROW_PACKAGE = 4
-    DB_ROW_SOLDER_JNT = 5
-    DB_ROW_MANF = 6
-    DB_ROW_LIB_TYPE = 7
-    DB_ROW_DESCR = 8
-    DB_ROW_DATASHEET = 9
-    DB_ROW_PRICE = 10
-    DB_ROW_STOCK = 11
-    DB_ROW_WORST_PRICE = 12
-    DB_ROW_MIN_QUANTITY = 13
-    DB_ROW_IMAGE = 14
 
 class TableColumnEnum(IntEnum):
     TABLE_COL_PART = 0
@@ -79,102 +59,91 @@ class BomColumnEnum(IntEnum):
     BOM_COL_IMAGE = 7
     BOM_COL_COUNT = 8
 
-class JlcCsvColumnEnum(IntEnum):
-    JLC_CSV_COMMENT = 0
-    JLC_CSV_DES = 1
-    JLC_CSV_FOOT = 2
-    JLC_CSV_PART = 3
-    JLC_CSV_COUNT = 4
-
-imageCacheDir = 'imageCache/'
-failedPartsFile = imageCacheDir +'failedParts.txt'
-defaultImage = 'no_image.png'
-defaultDbFile = 'jlc.db'
-defaultBomOutFile = 'jlcBom.csv'
-numFetchedImages = 0
-
-                 
-def getImage(imgUrl, lcscCode):
-    print('.', end='', flush=True)
-    try:
-        response = requests.get(imgUrl, timeout=3.05)
-        if response.status_code == 200:
-            file = open(imageCacheDir + lcscCode + '.jpg', 'wb')
-            file.write(response.content)
-            file.close()
-            return True
-        else:
-            return False
-    except BaseException as err:
-        print("Unexpected {err=}, {type(err)=}")        
-        print('html request threw exception.')
-        return False
-        
-def getimageFilename(row, failedPartsList):
-    lcscPart = row[DbRowEnum.DB_ROW_LCSC_PART]
-    imageFilename = lcscPart + '.jpg'
-    
+pixmapCacheBudget = 64*1024**2    # Bytes of decoded images kept in memory
+liveSearchDelay = 400             # Milliseconds after the last key press before searching
+
+class PixmapCache:
     '''
-     There are a number of variations of the url for the image - some of which look like typos
-     All are based on the datasheet name (for want of a better algorithm)
+     Decoded images shared by the search and BOM tables, keyed by (part, size) so a part that turns
+     up again isn't read from disk and decoded again. The least recently used are dropped once they
+     take up more than maxBytes. GUI thread only, that's the only place QPixmaps can be used
     '''
-    
-    if row[DbRowEnum.DB_ROW_DATASHEET].strip() == '':
-        # If there's no datasheet, best guess to image name is manufacture-partNumber_lcscPartNumber
-        partialImageName = row[DbRowEnum.DB_ROW_MANF] + '-' + row[DbRowEnum.DB_ROW_MFR_PART] + '_' + row[DbRowEnum.DB_ROW_LCSC_PART]
-    else:
-        try:
-            # Extract the part of the datasheet name that is useful
-            splitDatasheet = row[DbRowEnum.DB_ROW_DATASHEET].split('_', 1)
-            splitDatasheet = splitDatasheet[1].rsplit('.', 1)
-            partialImageName = splitDatasheet[0]
-        except:
-            return defaultImage
-    
-    global numFetchedImages
-    numFetchedImages += 1
-
-    imageUrlTemplates = ['https://assets.lcsc.com/images/lcsc/900x900/20180914_{0}_front.jpg',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20180914_{0}_front_10.jpg',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20180914_{0}_front_10.JPG',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20180914_{0}_front_11.jpg',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20280914_{0}_front.jpg',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20180914_{0}_1.jpg',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20180914_{0}_package.jpg',
-                         'https://assets.lcsc.com/images/lcsc/900x900/20200421_{0}_front.jpg'
-                         ]
-
-
-    imageFound = False
-    templateIndex = 0
-    for template in imageUrlTemplates:
-        if getImage(template.format(partialImageName), lcscPart):
-            imageFound = True
-            print('{0}'.format(templateIndex), end='', flush=True)
-            break
-        templateIndex += 1
-                  
-    if not imageFound:
-        with open(failedPartsFile, 'a') as failedParts:
-            failedParts.write(lcscPart + '.jpg\n')
-            failedPartsList.append(lcscPart + '.jpg')
-        
-        imageFilename = defaultImage
-
-    return imageFilename
+    def __init__(self, maxBytes=pixmapCacheBudget):
+        self.maxBytes = maxBytes
+        self.pixmaps = collections.OrderedDict()
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def pixmapBytes(self, pixmap):
+        return pixmap.width()*pixmap.height()*pixmap.depth()//8
+
+    def get(self, key):
+        pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        if key in self.pixmaps:
+            self.totalBytes -= self.pixmapBytes(self.pixmaps.pop(key))
+        self.pixmaps[key] = pixmap
+        self.totalBytes += self.pixmapBytes(pixmap)
+        while self.totalBytes > self.maxBytes and len(self.pixmaps) > 1:
+            oldKey, oldPixmap = self.pixmaps.popitem(last=False)
+            self.totalBytes -= self.pixmapBytes(oldPixmap)
+
+    def defaultPixmap(self, imageCache, size):
+        # The image for parts without one, scaled to size
+        pixmap = self.get((defaultImage, size))
+        if pixmap is None:
+            pixmap = QPixmap(imageCache.cacheDir + defaultImage).scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.put((defaultImage, size), pixmap)
+        return pixmap
+
+    def partPixmap(self, imageCache, lcscPart, size):
+        # A part's thumbnail (size is one of thumbnailSizes) or the default image, never downloads
+        if imageCache.status(lcscPart) == imageCached:
+            pixmap = self.get((lcscPart, size))
+            if pixmap is not None:
+                return pixmap
+            thumbnailFile = imageCache.thumbnail(lcscPart, size)
+            if thumbnailFile is not None:
+                pixmap = QPixmap(thumbnailFile)
+                self.put((lcscPart, size), pixmap)
+                return pixmap
+        return self.defaultPixmap(imageCache, size)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'pixmaps': len(self.pixmaps), 'bytes': self.totalBytes}
+
+
+pixmapCache = PixmapCache()
 
 class ImgLabel(QLabel):
     clicked = pyqtSignal()
     
     def __init__(self, img):
         super(ImgLabel, self).__init__()
+        self.setImage(img)
+
+    def setImage(self, img):
         self.pixmap = QPixmap(img)
+        self.scaledPix = None
+        self.update()
 
     def paintEvent(self, event):
         size = self.size()
         painter = QPainter(self)
         point = QPoint(0,0)
-        scaledPix = self.pixmap.scaled(size, Qt.KeepAspectRatio, transformMode = Qt.SmoothTransformation)
+        # Only rescaled when the label changes size, not every time it's painted
+        if self.scaledPix is None or self.scaledSize != size:
+            self.scaledPix = self.pixmap.scaled(size, Qt.KeepAspectRatio, transformMode = Qt.SmoothTransformation)
+            self.scaledSize = size
+        scaledPix = self.scaledPix
         # start painting the label from left upper corner
         point.setX(int((size.width() - scaledPix.width())/2))
         point.setY(int((size.height() - scaledPix.height())/2))
@@ -214,13 +183,296 @@ class PartAndDatasheetWidget(QWidget):
 
                         
                                         
-class PartTable(QTableWidget):
-        def __init__(self, currentImageList, failedImageList):
-            super().__init__(0, TableColumnEnum.TABLE_COL_COUNT)
-            self.setHorizontalHeaderLabels(['LCSC Part','Type','Description','Package','Manf','Price','Stock','Image'])
+class ThumbnailLoader(QObject):
+    '''
+     Downloads (if asked to) and scales thumbnails on background threads so the results can be shown
+     straight away. The newest request is always taken first, so the rows on screen now come before
+     ones that have already been scrolled past
+    '''
+    loaded = pyqtSignal(int, int, str, QImage) # generation, row index, image filename, thumbnail
+
+    def __init__(self, thumbnailSize, imageCache, numThreads=imageFetchConcurrency):
+        super().__init__()
+        self.thumbnailSize = thumbnailSize
+        self.imageCache = imageCache
+        self.numThreads = numThreads
+        self.threads = []
+        self.pending = []
+        self.generation = 0
+        self.condition = threading.Condition()
+
+    def request(self, rowIndex, row, imageFilename, download):
+        with self.condition:
+            if len(self.threads) == 0:
+                for i in range(self.numThreads):
+                    thread = threading.Thread(target=self.work, daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            self.pending.append((self.generation, rowIndex, row, imageFilename, download))
+            self.condition.notify()
+
+    def clear(self):
+        # Drop everything queued for the old results, anything already started is ignored by the model
+        with self.condition:
+            self.generation += 1
+            self.pending = []
+
+    def work(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                generation, rowIndex, row, imageFilename, download = self.pending.pop()
+
+            if download:
+                # A failed retry leaves any image already in the cache alone
+                downloaded = getimageFilename(row)
+                if downloaded != defaultImage:
+                    imageFilename = downloaded
+            thumbnail = QImage()
+            if imageFilename != defaultImage:
+                startTime = time.perf_counter()
+                thumbnailFile = self.imageCache.thumbnail(row[DbRowEnum.DB_ROW_LCSC_PART], self.thumbnailSize)
+                if thumbnailFile is not None:
+                    thumbnail = QImage(thumbnailFile)
+                phaseTimings.record('image.load', time.perf_counter() - startTime, row[DbRowEnum.DB_ROW_LCSC_PART])
+            self.loaded.emit(generation, rowIndex, imageFilename, thumbnail)
+
+
+class PartTableModel(QAbstractTableModel):
+    '''
+     Search results for the PartTable view. Rows are read from the pager (a SearchPager or PartListPager)
+     and handed to the view fetchSize at a time as it scrolls, and the text and thumbnails for a row
+     are only worked out when the view asks for them
+    '''
+    fetchSize = 100
+    thumbnailSize = cellImageSize
+    headerLabels = ['LCSC Part','Type','Description','Package','Manf','Price','Stock','Image']
+
+    def __init__(self, imageCache):
+        super().__init__()
+        self.imageCache = imageCache
+        self.pager = None
+        self.rows = []
+        self.downloadImages = False
+        self.images = {}
+        self.thumbnailLoader = ThumbnailLoader(self.thumbnailSize, imageCache)
+        self.thumbnailLoader.loaded.connect(self.thumbnailLoaded)
+
+    def setPager(self, pager, downloadImages):
+        self.beginResetModel()
+        self.thumbnailLoader.clear()
+        self.pager = pager
+        self.rows = []
+        self.downloadImages = downloadImages
+        self.images = {}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return TableColumnEnum.TABLE_COL_COUNT
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.pager is not None and not self.pager.finished
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        startTime = time.perf_counter()
+        rows = self.pager.nextRows(self.fetchSize)
+        if len(rows) > 0:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows += rows
+            self.endInsertRows()
+        phaseTimings.record('table.fetchMore', time.perf_counter() - startTime, '{0} rows'.format(len(rows)))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headerLabels[section]
+        return super().headerData(section, orientation, role)
+
+    def dbRow(self, rowIndex):
+        return self.rows[rowIndex]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == TableColumnEnum.TABLE_COL_PART:
+                return row[DbRowEnum.DB_ROW_LCSC_PART]
+            elif column == TableColumnEnum.TABLE_COL_EXT:
+                return row[DbRowEnum.DB_ROW_LIB_TYPE]
+            elif column == TableColumnEnum.TABLE_COL_DESC:
+                return row[DbRowEnum.DB_ROW_SEC_CAT] + ' ' + row[DbRowEnum.DB_ROW_DESCR]
+            elif column == TableColumnEnum.TABLE_COL_PKG:
+                return str(row[DbRowEnum.DB_ROW_PACKAGE]).replace('_','\n')
+            elif column == TableColumnEnum.TABLE_COL_MANF:
+                return row[DbRowEnum.DB_ROW_MANF] + '\n' + row[DbRowEnum.DB_ROW_MFR_PART]
+            elif column == TableColumnEnum.TABLE_COL_PRICE:
+                # Up to 4 price ranges
+                return '\n'.join(row[DbRowEnum.DB_ROW_PRICE].split(',')[:4])
+            elif column == TableColumnEnum.TABLE_COL_STOCK:
+                return str(row[DbRowEnum.DB_ROW_STOCK])
+        elif role == Qt.DecorationRole and column == TableColumnEnum.TABLE_COL_IMAGE:
+            return self.image(index.row())[2]
+        elif role == Qt.ToolTipRole and column == TableColumnEnum.TABLE_COL_IMAGE:
+            imageFilename, downloadable, thumbnail = self.image(index.row())
+            if imageFilename != defaultImage:
+                tooltipFile = self.imageCache.thumbnailFilename(row[DbRowEnum.DB_ROW_LCSC_PART], tooltipImageSize)
+                return '<img src="'+ tooltipFile + '" width="300" height="300">'
+            elif thumbnail is None:
+                return 'Loading image...'
+            elif downloadable:
+                return 'Click to try to download image'
+        return None
+
+    def image(self, rowIndex):
+        '''
+         (image filename, whether clicking might download it, thumbnail) for a row. The thumbnail is
+         None until the loader has got it, then the cell is updated
+        '''
+        if rowIndex not in self.images:
+            row = self.rows[rowIndex]
+            status = self.imageCache.status(row[DbRowEnum.DB_ROW_LCSC_PART])
+
+            if status == imageFailed:
+                # Not worth trying again by itself yet, but a click still does
+                self.images[rowIndex] = (defaultImage, True, self.thumbnail(defaultImage))
+            elif status == imageCached:
+                imageFilename = row[DbRowEnum.DB_ROW_LCSC_PART] + '.jpg'
+                # Already decoded by an earlier search or the BOM, otherwise the loader reads it
+                thumbnail = pixmapCache.get((row[DbRowEnum.DB_ROW_LCSC_PART], self.thumbnailSize))
+                self.images[rowIndex] = (imageFilename, True, thumbnail)
+                if thumbnail is None:
+                    self.thumbnailLoader.request(rowIndex, row, imageFilename, False)
+            elif self.downloadImages:
+                self.images[rowIndex] = (defaultImage, True, None)
+                self.thumbnailLoader.request(rowIndex, row, defaultImage, True)
+            else:
+                self.images[rowIndex] = (defaultImage, True, self.thumbnail(defaultImage))
+        return self.images[rowIndex]
+
+    def thumbnail(self, imageFilename):
+        # Only used for the default image, every row without an image shares the one pixmap
+        return pixmapCache.defaultPixmap(self.imageCache, self.thumbnailSize)
+
+    def thumbnailLoaded(self, generation, rowIndex, imageFilename, thumbnail):
+        if generation != self.thumbnailLoader.generation:
+            return
+        if imageFilename == defaultImage:
+            self.images[rowIndex] = (defaultImage, True, self.thumbnail(defaultImage))
+        else:
+            pixmap = QPixmap.fromImage(thumbnail)
+            pixmapCache.put((self.rows[rowIndex][DbRowEnum.DB_ROW_LCSC_PART], self.thumbnailSize), pixmap)
+            self.images[rowIndex] = (imageFilename, True, pixmap)
+        imageIndex = self.index(rowIndex, TableColumnEnum.TABLE_COL_IMAGE)
+        self.dataChanged.emit(imageIndex, imageIndex)
+
+    def imageClicked(self, rowIndex):
+        imageFilename, downloadable, thumbnail = self.image(rowIndex)
+        if thumbnail is not None and (imageFilename != defaultImage or downloadable):
+            if imageFilename == defaultImage:
+                self.imageCache.clearFailed(self.rows[rowIndex][DbRowEnum.DB_ROW_LCSC_PART])
+            self.images[rowIndex] = (imageFilename, downloadable, None)
+            self.thumbnailLoader.request(rowIndex, self.rows[rowIndex], imageFilename, True)
+            imageIndex = self.index(rowIndex, TableColumnEnum.TABLE_COL_IMAGE)
+            self.dataChanged.emit(imageIndex, imageIndex)
+
+
+class PartLinkDelegate(QStyledItemDelegate):
+    '''
+     Paints the LCSC part number and datasheet as links and opens them when clicked,
+     instead of a widget full of QLabels in every row
+    '''
+    def linkRects(self, option, hasDatasheet):
+        lineHeight = option.fontMetrics.height()
+        numLines = 2 if hasDatasheet else 1
+        top = option.rect.top() + int((option.rect.height() - numLines*lineHeight)/2)
+        partRect = QRect(option.rect.left() + 4, top, option.rect.width() - 8, lineHeight)
+        return partRect, partRect.translated(0, lineHeight)
+
+    def paint(self, painter, option, index):
+        row = index.model().dbRow(index.row())
+        datasheet = row[DbRowEnum.DB_ROW_DATASHEET].strip()
+        
+        # Background and selection as normal, then the links on top
+        self.initStyleOption(option, index)
+        option.text = ''
+        QApplication.style().drawControl(QStyle.CE_ItemViewItem, option, painter)
+
+        partRect, datasheetRect = self.linkRects(option, datasheet != '')
+        painter.save()
+        font = QFont(option.font)
+        font.setUnderline(True)
+        painter.setFont(font)
+        painter.setPen(option.palette.color(QPalette.Link))
+        painter.drawText(partRect, Qt.AlignLeft | Qt.AlignVCenter, row[DbRowEnum.DB_ROW_LCSC_PART])
+        if datasheet != '':
+            painter.drawText(datasheetRect, Qt.AlignLeft | Qt.AlignVCenter, 'Datasheet')
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            row = model.dbRow(index.row())
+            datasheet = row[DbRowEnum.DB_ROW_DATASHEET].strip()
+            partRect, datasheetRect = self.linkRects(option, datasheet != '')
+            if partRect.contains(event.pos()):
+                QDesktopServices.openUrl(QUrl('https://lcsc.com/search?q={0}'.format(row[DbRowEnum.DB_ROW_LCSC_PART])))
+                return True
+            if datasheet != '' and datasheetRect.contains(event.pos()):
+                QDesktopServices.openUrl(QUrl(datasheet))
+                return True
+        return False
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    # Paints the thumbnail centred in the cell, clicking tries to (re)load the image
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        option.icon = QIcon()
+        QApplication.style().drawControl(QStyle.CE_ItemViewItem, option, painter)
+
+        thumbnail = index.data(Qt.DecorationRole)
+        if thumbnail is not None:
+            size = thumbnail.size().scaled(option.rect.size(), Qt.KeepAspectRatio)
+            targetRect = QRect(QPoint(0, 0), size)
+            targetRect.moveCenter(option.rect.center())
+            painter.drawPixmap(targetRect, thumbnail)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            model.imageClicked(index.row())
+            return True
+        return False
+
+
+class PartTable(QTableView):
+        '''
+         Search results. Only the rows that are on screen cost anything to draw, so a search that
+         finds thousands of parts shows up straight away
+        '''
+        itemSelectionChanged = pyqtSignal()
+
+        def __init__(self, imageCache):
+            super().__init__()
+            self.partModel = PartTableModel(imageCache)
+            self.setModel(self.partModel)
+            self.selectionModel().selectionChanged.connect(self.itemSelectionChanged)
+
+            # Fixed height rows mean the view never has to measure rows it isn't showing
             verticalHeader = self.verticalHeader()
-            verticalHeader.setMinimumSectionSize(100)
-            self.setEditTriggers(QTableWidget.NoEditTriggers)
+            verticalHeader.setSectionResizeMode(QHeaderView.Fixed)
+            verticalHeader.setDefaultSectionSize(100)
+            self.setEditTriggers(QTableView.NoEditTriggers)
             self.setColumnWidth(TableColumnEnum.TABLE_COL_PART, 80)
             self.setColumnWidth(TableColumnEnum.TABLE_COL_EXT, 60)
             self.setColumnWidth(TableColumnEnum.TABLE_COL_DESC, 210)
@@ -229,83 +481,74 @@ class PartTable(QTableWidget):
             self.setColumnWidth(TableColumnEnum.TABLE_COL_PRICE, 130)
             self.setColumnWidth(TableColumnEnum.TABLE_COL_STOCK, 60)
             self.setColumnWidth(TableColumnEnum.TABLE_COL_IMAGE, 100)
+
+            self.partLinkDelegate = PartLinkDelegate(self)
+            self.thumbnailDelegate = ThumbnailDelegate(self)
+            self.setItemDelegateForColumn(TableColumnEnum.TABLE_COL_PART, self.partLinkDelegate)
+            self.setItemDelegateForColumn(TableColumnEnum.TABLE_COL_IMAGE, self.thumbnailDelegate)
             
-            self.currentImageList = currentImageList
-            self.failedPartsList = failedImageList
-        
+        def currentRow(self):
+            return self.currentIndex().row()
             
         def getSelectedLcscPartNumber(self, rowIndex):
-            return self.cellWidget(rowIndex, TableColumnEnum.TABLE_COL_PART).getLcscPartNumber()
+            return self.partModel.dbRow(rowIndex)[DbRowEnum.DB_ROW_LCSC_PART]
         
-        def imageClicked(self, row, imgLabel):
-            imageFilename = getimageFilename(row, self.failedPartsList)
-            if imageFilename != defaultImage:
-                imgLabel.pixmap = QPixmap(imageCacheDir + imageFilename)
-                imgLabel.repaint()
-        
-        def openLink(self, linkStr):
-                QDesktopServices.openUrl(QUrl(linkStr.replace('%3d','=')))
-        
-        def searchPopulate(self, rows, downloadImages):                                
-            self.setRowCount(0)                
-
-            for row in rows:
-                rowPosition = self.rowCount()
-                self.insertRow(rowPosition)
-                
-                # Add up to 4 price ranges
-                prices = row[DbRowEnum.DB_ROW_PRICE].split(',')
-                priceField = prices[0]
-                if len(prices) > 1:
-                    priceField +=  '\n' + prices[1]
-                if len(prices) > 2:
-                    priceField +=  '\n' + prices[2]
-                if len(prices) > 3:
-                    priceField +=  '\n' + prices[3]
-                
-                if row[DbRowEnum.DB_ROW_DATASHEET].strip() == '':   
-                    datasheetLinkText = ''                  
-                else:
-                    datasheetLinkText = "<a href={0}>Datasheet</a>".format(row[DbRowEnum.DB_ROW_DATASHEET])
-                partAndDatasheetWidget = PartAndDatasheetWidget(row[DbRowEnum.DB_ROW_LCSC_PART], datasheetLinkText)
-                self.setCellWidget(rowPosition, TableColumnEnum.TABLE_COL_PART, partAndDatasheetWidget)
-
-                self.setItem(rowPosition, TableColumnEnum.TABLE_COL_EXT,   QTableWidgetItem(row[DbRowEnum.DB_ROW_LIB_TYPE]))
-                self.setItem(rowPosition, TableColumnEnum.TABLE_COL_DESC,  QTableWidgetItem(row[DbRowEnum.DB_ROW_SEC_CAT] + ' ' + row[DbRowEnum.DB_ROW_DESCR]))
-                self.setItem(rowPosition, TableColumnEnum.TABLE_COL_PKG,   QTableWidgetItem(str(row[DbRowEnum.DB_ROW_PACKAGE]).replace('_','\n')))
-                self.setItem(rowPosition, TableColumnEnum.TABLE_COL_MANF,  QTableWidgetItem(row[DbRowEnum.DB_ROW_MANF] + '\n' + row[DbRowEnum.DB_ROW_MFR_PART]))
-                self.setItem(rowPosition, TableColumnEnum.TABLE_COL_PRICE, QTableWidgetItem(priceField))
-                self.setItem(rowPosition, TableColumnEnum.TABLE_COL_STOCK, QTableWidgetItem(row[DbRowEnum.DB_ROW_STOCK]))
-                
-                imageFilename = row[DbRowEnum.DB_ROW_LCSC_PART] + '.jpg'
+        def searchPopulate(self, pager, downloadImages):
+            self.partModel.setPager(pager, downloadImages)
+            self.scrollToTop()
+
+
+class ConvertWorker(QObject):
+    '''
+     Runs a Converter on a background thread, passing on what it says as signals
+    '''
+    progress = pyqtSignal(int, int, int)  # Rows converted, estimated rows in the file, progress out of 10000
+    status = pyqtSignal(str)
+    finished = pyqtSignal(bool)           # True if it wasn't aborted
 
-                imageNotInFailedList = False
-                if imageFilename not in self.failedPartsList:
-                    imageNotInFailedList = True
-                    if imageFilename not in self.currentImageList:
-                        if downloadImages:
-                            imageFilename = getimageFilename(row, self.failedPartsList)
-                            if imageFilename == defaultImage:
-                                imageNotInFailedList = False
-                        else:
-                            imageFilename = defaultImage
-                else:
-                    imageFilename = defaultImage
-                                    
-                imgLabel = ImgLabel(imageCacheDir + imageFilename)
-                imgLabel.setScaledContents(True)
-                
-                # If it might have been possible to download the image, clicking will do that
-                if imageFilename == defaultImage:
-                    if imageNotInFailedList:
-                        imgLabel.clicked.connect(partial(self.imageClicked, row, imgLabel))
-                        imgLabel.setToolTip('Click to try to download image')
-                else:
-                    imgLabel.clicked.connect(partial(self.imageClicked, row, imgLabel))
-                    tooltip = '<img src="'+ imageCacheDir + imageFilename + '" width="300" height="300">'
-                    imgLabel.setToolTip(tooltip)
-
-                self.setCellWidget(rowPosition, TableColumnEnum.TABLE_COL_IMAGE, imgLabel)
+    def __init__(self, csvFilename, dbFilename, cacheAllImages, imageCache, updateExisting=False,
+                 imageConcurrency=imageFetchConcurrency):
+        super().__init__()
+        self.converter = Converter(csvFilename, dbFilename, cacheAllImages, imageCache, updateExisting, imageConcurrency,
+                                   self.progress.emit, self.status.emit)
+
+    def cancel(self):
+        self.converter.cancel()
+
+    def run(self):
+        # Always finishes, or the button stays on Abort and closing the window waits forever
+        completed = False
+        try:
+            completed = self.converter.run()
+        except Exception as error:
+            traceback.print_exc()
+            self.status.emit("Conversion failed: {0}".format(error))
+        self.finished.emit(completed)
+
+
+class BomMatchWorker(QObject):
+    '''
+     Runs a BomMatcher on a background thread, sending each match back as a signal
+    '''
+    matched = pyqtSignal(int, object)     # BOM table row, jlc row or None if nothing matched
+    finished = pyqtSignal(bool)           # True if it wasn't stopped
+
+    def __init__(self, dbFilename, lines, useExtended, numThreads=bomMatchThreads):
+        super().__init__()
+        self.matcher = BomMatcher(dbFilename, lines, useExtended, numThreads, self.matched.emit)
+        self.cancelled = self.matcher.cancelled
+
+    def cancel(self):
+        self.matcher.cancel()
+
+    def run(self):
+        # Always finishes, or the button stays on Stop and closing the window waits forever
+        completed = False
+        try:
+            completed = self.matcher.run()
+        except Exception:
+            traceback.print_exc()
+        self.finished.emit(completed)
 
 
 class JlcSearch(QDialog):
@@ -321,20 +564,13 @@ class JlcSearch(QDialog):
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
 
         self.converting = False
+        self.bomMatching = False
         
-        # Get the available images and the never-to-be-available images into 2 lists
-        self.currentImageList = os.listdir(imageCacheDir)
-        
-        try:
-            with open(failedPartsFile, 'r') as failedParts:
-                self.failedPartsList = failedParts.read().splitlines()
-        except:
-            self.failedPartsList = []
+        # Which parts have images and which never will, read the first time it's needed
+        self.imageCache = getImageCache()
         
         # todo make this a parameter
         self.allowCachingDuringScan = allowCachingDuringScan
-        global numFetchedImages
-        numFetchedImages = len(self.currentImageList) + len(self.failedPartsList)
         self.dbLength = 1
         
         self.tabWidget = QTabWidget()
@@ -366,6 +602,13 @@ class JlcSearch(QDialog):
         self.findFiles.clicked.connect(partial(self.getCsvFile, self.csvFile))
         self.cacheAllImages = QCheckBox("Force all images to be cached (takes hours and gigabytes of disk space!)")
         self.clearFailedImages = QCheckBox("Clear list of failed images")
+        self.imageConcurrency = QSpinBox()
+        self.imageConcurrency.setRange(1, 64)
+        self.imageConcurrency.setValue(imageFetchConcurrency)
+        self.imageConcurrencyLabel = QLabel("Parallel image downloads:")
+        self.imageConcurrencyLabel.setBuddy(self.imageConcurrency)
+        self.updateExisting = QCheckBox("Only update parts that have changed (the database can still be searched meanwhile)")
+        self.updateExisting.setChecked(True)
         self.dbFileName = QLineEdit(defaultDbFile)
         self.dbFileNameLabel = QLabel("Database Filename:")
         self.dbFileNameLabel.setBuddy(self.dbFileName)
@@ -397,13 +640,19 @@ class JlcSearch(QDialog):
         if self.allowCachingDuringScan:
             convertLayout.addWidget(self.cacheAllImages, 2, 0, 2, 1)
             convertLayout.addWidget(self.clearFailedImages, 2, 1, 2, 1)
-        convertLayout.addLayout(dbFileLayout, 3, 0, 2, 2)
+        convertLayout.addLayout(dbFileLayout, 3, 0, 2, 1)
+        convertLayout.addWidget(self.updateExisting, 3, 1, 2, 1)
         convertLayout.addWidget(self.convertNow, 4, 0, 2, 1)
         convertLayout.addWidget(self.convertStatus, 4, 1, 2, 1)
         convertLayout.addWidget(self.progressBar, 5, 0, 2, 2)
         
         if self.allowCachingDuringScan:
-            convertLayout.addWidget(self.cachingStats, 6, 0, 2, 2)
+            imageConcurrencyLayout = QHBoxLayout()
+            imageConcurrencyLayout.addWidget(self.imageConcurrencyLabel)
+            imageConcurrencyLayout.addWidget(self.imageConcurrency)
+            imageConcurrencyLayout.addStretch()
+            convertLayout.addWidget(self.cachingStats, 6, 0, 2, 1)
+            convertLayout.addLayout(imageConcurrencyLayout, 6, 1, 2, 1)
 
         convertTab.setLayout(convertLayout)
 
@@ -421,12 +670,26 @@ class JlcSearch(QDialog):
         self.sortType.clicked.connect(self.sortType_clicked)
         self.update = QPushButton("Update")
         self.update.clicked.connect(self.update_clicked)
+        self.partSearcher = PartSearcher(self.dbFileName.text())
+
+        # Search as you type, once typing stops for a moment
+        self.liveSearchTimer = QTimer(self)
+        self.liveSearchTimer.setSingleShot(True)
+        self.liveSearchTimer.setInterval(liveSearchDelay)
+        self.liveSearchTimer.timeout.connect(self.liveSearch)
+        self.keywords.textChanged.connect(self.liveSearchTimer.start)
+        self.packages.textChanged.connect(self.liveSearchTimer.start)
+        self.quantity = QSpinBox()
+        self.quantity.setRange(1, 10000000)
+        self.quantity.setToolTip('Number of parts wanted, prices and stock checks are for this quantity')
+        self.quantityLabel = QLabel("Qty:")
+        self.quantityLabel.setBuddy(self.quantity)
         self.useExtendedCheckBox = QCheckBox("Extended Parts")
         #self.useExtendedCheckBox.setChecked(True)
         self.loadImages = QCheckBox("Load Images")
         self.loadImages.setChecked(True)
         
-        self.partTable = PartTable(self.currentImageList, self.failedPartsList)
+        self.partTable = PartTable(self.imageCache)
         self.partTable.itemSelectionChanged.connect(self.partSelected)
 
         
@@ -438,6 +701,8 @@ class JlcSearch(QDialog):
         topLayout.addWidget(self.keywords)
         topLayout.addWidget(self.packageLabel)
         topLayout.addWidget(self.packages)
+        topLayout.addWidget(self.quantityLabel)
+        topLayout.addWidget(self.quantity)
         topLayout.addWidget(self.useExtendedCheckBox)
         topLayout.addWidget(self.loadImages)
         topLayout.addWidget(self.sortType)
@@ -446,6 +711,8 @@ class JlcSearch(QDialog):
         searchLayout = QGridLayout()
         searchLayout.addLayout(topLayout, 0, 0, 1, 2)
         searchLayout.addWidget(self.partTable)
+        self.searchStatus = QLabel()
+        searchLayout.addWidget(self.searchStatus)
         searchTab.setLayout(searchLayout)
 
         ''' BOM Tab widgets
@@ -518,13 +785,41 @@ class JlcSearch(QDialog):
         bomLayout.addWidget(self.bomTable)
         bomTab.setLayout(bomLayout)
 
-                
+
+        '''
+            Diagnostics tab, where the time's going and how well the caches are doing
+        '''
+        diagnosticsTab = QWidget()
+        self.diagnosticsText = QPlainTextEdit()
+        self.diagnosticsText.setReadOnly(True)
+        self.diagnosticsText.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.diagnosticsText.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.diagnosticsRefresh = QPushButton("Refresh")
+        self.diagnosticsRefresh.clicked.connect(self.diagnosticsShow)
+        self.diagnosticsClear = QPushButton("Clear Timings")
+        self.diagnosticsClear.clicked.connect(self.diagnosticsClearTimings)
+        self.timingLogCheckBox = QCheckBox("Log Timings To {0}".format(timingLogFile))
+        self.timingLogCheckBox.toggled.connect(self.timingLogToggled)
+
+        diagnosticsCtrlLayout = QHBoxLayout()
+        diagnosticsCtrlLayout.addWidget(self.diagnosticsRefresh)
+        diagnosticsCtrlLayout.addWidget(self.diagnosticsClear)
+        diagnosticsCtrlLayout.addWidget(self.timingLogCheckBox)
+        diagnosticsCtrlLayout.addStretch()
+
+        diagnosticsLayout = QVBoxLayout()
+        diagnosticsLayout.addLayout(diagnosticsCtrlLayout)
+        diagnosticsLayout.addWidget(self.diagnosticsText)
+        diagnosticsTab.setLayout(diagnosticsLayout)
+
         '''
             Tabs top level
         '''
         self.tabWidget.addTab(convertTab, "Convert")
         self.tabWidget.addTab(searchTab, "Search")
         self.tabWidget.addTab(bomTab, "BOM")
+        self.diagnosticsTabIndex = self.tabWidget.addTab(diagnosticsTab, "Diagnostics")
+        self.tabWidget.currentChanged.connect(self.tabChanged)
         self.setLayout(tabsLayout)
         
         if os.path.isfile(self.dbFileName.text()):
@@ -533,120 +828,124 @@ class JlcSearch(QDialog):
         self.setWindowTitle("JLCPCP Parts Search")
         QApplication.setStyle(QStyleFactory.create(('Fusion')))
     
+    def tabChanged(self, index):
+        if index == self.diagnosticsTabIndex:
+            self.diagnosticsShow()
+
+    def diagnosticsShow(self):
+        def statsText(stats):
+            return ', '.join('{0} {1}'.format(name, value) for name, value in stats.items())
+
+        if jlccore.sharedImageFetcher is not None:
+            downloads = '{0:.2f} requests per image'.format(jlccore.sharedImageFetcher.requestsPerImage())
+        else:
+            downloads = 'nothing downloaded yet'
+        self.diagnosticsText.setPlainText('\n'.join([phaseTimings.report(), '',
+                                                     'Thumbnails in memory: ' + statsText(pixmapCache.stats()),
+                                                     'Search cache: ' + statsText(self.partSearcher.searchCache.stats()),
+                                                     'Image downloads: ' + downloads, '',
+                                                     'Last search:', self.partSearcher.explain() or 'none yet']))
+
+    def diagnosticsClearTimings(self):
+        phaseTimings.clear()
+        self.diagnosticsShow()
+
+    def timingLogToggled(self, checked):
+        if checked:
+            phaseTimings.startLog()
+        else:
+            phaseTimings.stopLog()
+
     def getCsvFile(self, qlist):
         fname = QFileDialog.getOpenFileName(self, caption='CSV FIle', filter='*.csv')
         qlist.clear()
         qlist.addItem(fname[0])
 
-    def fixUpOddChars(self, rawString):
-        # Use a dictionary of string conversions
-        replacements = {u'\xa6\xcc': 'u',   # micro
-                        u'\xa6\xb8': 'R',   # Ohms
-                        u'\xa1\xc0': '+/-', # Plus or minus
-                        u'\xa1\xe6': 'C',   # Celcius
-                        u'\xa3\xa5': '%'    # Percent
-                        }
-
-        replacements = {key: val for key, val in replacements.items()}
-        pattern = re.compile("|".join(replacements))
-        newString = pattern.sub(lambda match: replacements[match.group(0)], rawString)  
-        return newString
-    
     def imageClicked(self, row, imgLabel):
-        imageFilename = getimageFilename(row, self.failedPartsList)
+        self.imageCache.clearFailed(row[DbRowEnum.DB_ROW_LCSC_PART])
+        imageFilename = getimageFilename(row)
         if imageFilename != defaultImage:
-            imgLabel.pixmap = QPixmap(imageCacheDir + imageFilename)
-            imgLabel.repaint()
+            imgLabel.setImage(pixmapCache.partPixmap(self.imageCache, row[DbRowEnum.DB_ROW_LCSC_PART], cellImageSize))
+
+    def databaseUsable(self):
+        # Explain if there's no database or it was converted by an older version with a different schema
+        message = databaseProblem(self.dbFileName.text())
+        if message is None:
+            return True
+        
+        error_dialog = QErrorMessage()
+        error_dialog.showMessage(message)
+        error_dialog.exec_()
+        return False
     
     def bomWrite(self):
-        with open(defaultBomOutFile, 'w') as bomFile:
-            bomFile.write('Comment,Designator,Footprint,LCSC Part #\n')
-            
-            self.bomWriteButton.setText("Writing...")
-            QApplication.processEvents()
-
-            for rowIndex in range(self.bomTable.rowCount()):
-                commentData = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).text()
-                designator = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_DES).text()
-                footprintData = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_FOOT).text()
-                lcscPart = self.bomTable.cellWidget(rowIndex, BomColumnEnum.BOM_COL_PART).getLcscPartNumber()
+        self.bomWriteButton.setText("Writing...")
+        QApplication.processEvents()
 
-                bomFile.write(commentData + ',' + designator + ',' + footprintData + ',' + lcscPart + '\n')
+        bom = []
+        for rowIndex in range(self.bomTable.rowCount()):
+            commentData = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).text()
+            designator = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_DES).text()
+            footprintData = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_FOOT).text()
+            lcscPart = self.bomTable.cellWidget(rowIndex, BomColumnEnum.BOM_COL_PART).getLcscPartNumber()
+            bom.append([commentData, designator, footprintData, lcscPart])
+        writeBom(defaultBomOutFile, bom)
             
-            print("BOM Written")
-            self.bomWriteButton.setText("Write BOM")
-        
-    def bomPopulateRow(self, rowPosition, bomData):
-        if not os.path.isfile(self.dbFileName.text()):
-            error_dialog = QErrorMessage()
-            error_dialog.showMessage('Can\'t find database file: {0}'.format(self.dbFileName.text()))
-            error_dialog.exec_()
-        else:
-            self.con = sqlite3.connect(self.dbFileName.text())
-
-            cur = self.con.cursor()
-
-            self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_COMMENT,   QTableWidgetItem(bomData[BomColumnEnum.BOM_COL_COMMENT]))
-            self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_DES,   QTableWidgetItem(bomData[BomColumnEnum.BOM_COL_DES]))
-            self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_FOOT,   QTableWidgetItem(bomData[BomColumnEnum.BOM_COL_FOOT]))
-            self.bomTable.setCellWidget(rowPosition, BomColumnEnum.BOM_COL_PART, PartAndDatasheetWidget(bomData[BomColumnEnum.BOM_COL_PART], '')) 
-                #self.setItem(rowPosition, BomColumnEnum.BOM_COL_PART,   QTableWidgetItem(row[BomColumnEnum.BOM_COL_PART]))
-                
-            if bomData[BomColumnEnum.BOM_COL_PART] != '':                            
-                cur.execute("SELECT * FROM jlc WHERE LCSCPart = '{0}'".format(bomData[BomColumnEnum.BOM_COL_PART]))
-                dbRows = cur.fetchall()
-                
-                # Hopefully there's only one row
-                if len(dbRows) >= 1:
-                    dbData = dbRows[0]
-                    if dbData[DbRowEnum.DB_ROW_LIB_TYPE] == 'Basic':
-                        typeMarker = 'Y'
-                    else:
-                        typeMarker = 'N'
-
-                    self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_BASIC,   QTableWidgetItem(typeMarker))
-                    pricePer = round(dbData[DbRowEnum.DB_ROW_WORST_PRICE]/dbData[DbRowEnum.DB_ROW_MIN_QUANTITY],4)
-                    
-                    self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_PRICE,   QTableWidgetItem(str(pricePer)))
-                    self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_STOCK,   QTableWidgetItem(str(dbData[DbRowEnum.DB_ROW_STOCK])))
-
+        print("BOM Written")
+        self.bomWriteButton.setText("Write BOM")
+        
+    def bomPopulateRow(self, rowPosition, bomData, dbData):
+        # dbData is the jlc row for the BOM's LCSC part, None if it hasn't got one or it isn't at JLC
+        self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_COMMENT,   QTableWidgetItem(bomData[BomColumnEnum.BOM_COL_COMMENT]))
+        self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_DES,   QTableWidgetItem(bomData[BomColumnEnum.BOM_COL_DES]))
+        self.bomTable.setItem(rowPosition, BomColumnEnum.BOM_COL_FOOT,   QTableWidgetItem(bomData[BomColumnEnum.BOM_COL_FOOT]))
+        self.bomTable.setCellWidget(rowPosition, BomColumnEnum.BOM_COL_PART, PartAndDatasheetWidget(bomData[BomColumnEnum.BOM_COL_PART], '')) 
+            #self.setItem(rowPosition, BomColumnEnum.BOM_COL_PART,   QTableWidgetItem(row[BomColumnEnum.BOM_COL_PART]))
             
-                imageFilename = bomData[BomColumnEnum.BOM_COL_PART] + '.jpg'
+        if bomData[BomColumnEnum.BOM_COL_PART] != '':                            
+            if dbData is not None:
+                self.bomShowPartData(rowPosition, dbData)
+            self.bomShowImage(rowPosition, bomData[BomColumnEnum.BOM_COL_PART])
+
+    def bomShowPartData(self, rowIndex, dbData):
+        if dbData[DbRowEnum.DB_ROW_LIB_TYPE] == 'Basic':
+            typeMarker = 'Y'
+        else:
+            typeMarker = 'N'
+        self.bomTable.setItem(rowIndex, BomColumnEnum.BOM_COL_BASIC,   QTableWidgetItem(typeMarker))
+        
+        pricePer = round(dbData[DbRowEnum.DB_ROW_UNIT_PRICE],4)
+        self.bomTable.setItem(rowIndex, BomColumnEnum.BOM_COL_PRICE,   QTableWidgetItem(str(pricePer)))
+        self.bomTable.setItem(rowIndex, BomColumnEnum.BOM_COL_STOCK,   QTableWidgetItem(str(dbData[DbRowEnum.DB_ROW_STOCK])))
 
-                if imageFilename not in self.currentImageList:
-                    imageFilename = defaultImage
-                                    
-                imgLabel = ImgLabel(imageCacheDir + imageFilename)
-                imgLabel.setScaledContents(True)
-                
-                if imageFilename != defaultImage:
-                    tooltip = '<img src="'+ imageCacheDir + imageFilename + '" width="300" height="300">'
-                    imgLabel.setToolTip(tooltip)
+    def bomShowImage(self, rowIndex, lcscPart):
+        imgLabel = ImgLabel(pixmapCache.partPixmap(self.imageCache, lcscPart, cellImageSize))
+        imgLabel.setScaledContents(True)
+        
+        if self.imageCache.status(lcscPart) == imageCached:
+            tooltipFile = self.imageCache.thumbnailFilename(lcscPart, tooltipImageSize)
+            tooltip = '<img src="'+ tooltipFile + '" width="300" height="300">'
+            imgLabel.setToolTip(tooltip)
 
-                self.bomTable.setCellWidget(rowPosition, BomColumnEnum.BOM_COL_IMAGE, imgLabel)
+        self.bomTable.setCellWidget(rowIndex, BomColumnEnum.BOM_COL_IMAGE, imgLabel)
         
     def bomPopulateTable(self):
-        with open(self.bomFile.currentText()) as csvFile:
-            self.numBomRows = sum(1 for line in csvFile)
-        
-        jlcBom = []
-        with open(self.bomFile.currentText(), newline='') as csvFile:
-            reader = csv.reader(csvFile,delimiter=',')
-            self.bomTable.setCurrentCell(0,0)
-            self.populatingBomTable = True
-            for row in reader:
-                if len(row) and row[JlcCsvColumnEnum.JLC_CSV_COMMENT] != 'Comment':
-                    jlcBom.append([row[JlcCsvColumnEnum.JLC_CSV_COMMENT],
-                                   row[JlcCsvColumnEnum.JLC_CSV_DES],
-                                   row[JlcCsvColumnEnum.JLC_CSV_FOOT],
-                                   row[JlcCsvColumnEnum.JLC_CSV_PART]])
-                                        
+        jlcBom = readBom(self.bomFile.currentText())
+        self.bomTable.setCurrentCell(0,0)
+        self.populatingBomTable = True
 
-            self.bomTable.setRowCount(0)
+        # Any results still to come from matching are for the old rows
+        if self.bomMatching:
+            self.bomMatchWorker.cancel()
+        self.bomTable.setRowCount(0)
+        if self.databaseUsable():
+            resolver = BomResolver(self.dbFileName.text())
+            knownParts = resolver.knownParts([row[BomColumnEnum.BOM_COL_PART] for row in jlcBom])
+            resolver.close()
             for row in jlcBom:
                 rowPosition = self.bomTable.rowCount()
                 self.bomTable.insertRow(rowPosition)
-                self.bomPopulateRow(rowPosition, row)
+                self.bomPopulateRow(rowPosition, row, knownParts.get(row[BomColumnEnum.BOM_COL_PART]))
         self.populatingBomTable = False
     
     def openLink(self, linkStr):
@@ -656,7 +955,7 @@ class JlcSearch(QDialog):
         if not self.populatingBomTable:
             currentRow = self.bomTable.currentRow()
             self.keywords.setText(self.bomTable.item(currentRow, BomColumnEnum.BOM_COL_COMMENT).text())
-            self.packages.setText(self.bomTable.item(currentRow, BomColumnEnum.BOM_COL_FOOT).text().replace('_', ' '))
+            self.packages.setText(canonicalPackage(self.bomTable.item(currentRow, BomColumnEnum.BOM_COL_FOOT).text()))
             self.useExtendedCheckBox.setChecked(self.useExtendedinBomCheckBox.isChecked())
             self.selectingNewPart = True
             self.tabWidget.setCurrentIndex(1)
@@ -675,270 +974,137 @@ class JlcSearch(QDialog):
 
         
     def bomSearch(self):
-        if not os.path.isfile(self.dbFileName.text()):
-            error_dialog = QErrorMessage()
-            error_dialog.showMessage('Can\'t find database file: {0}'.format(self.dbFileName.text()))
-            error_dialog.exec_()
-        else:
-            self.con = sqlite3.connect(self.dbFileName.text())
+        if self.bomMatching:
+            self.bomMatchWorker.cancel()
+            self.bomSearchForParts.setText("Stopping...")
+            self.bomSearchForParts.setEnabled(False)
+        elif self.databaseUsable():
+            self.bomMatching = True
+            self.bomSearchForParts.setText("Stop")
 
-            self.bomSearchForParts.setText("Searching...")
-            QApplication.processEvents()
+            lines = [(self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).text(),
+                      self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_FOOT).text()) for rowIndex in range(self.bomTable.rowCount())]
+            self.bomMatchThread = QThread()
+            self.bomMatchWorker = BomMatchWorker(self.dbFileName.text(), lines, self.useExtendedinBomCheckBox.isChecked())
+            self.bomMatchWorker.moveToThread(self.bomMatchThread)
+            self.bomMatchThread.started.connect(self.bomMatchWorker.run)
+            self.bomMatchWorker.matched.connect(self.bomShowMatch)
+            self.bomMatchWorker.finished.connect(self.bomMatchFinished)
+            # Direct so the thread still stops when closeEvent has the GUI thread waiting for it
+            self.bomMatchWorker.finished.connect(self.bomMatchThread.quit, Qt.DirectConnection)
+            self.bomMatchThread.start()
 
-            cur = self.con.cursor()
-                        
-            # Populate in reversed so you can definitely see last item updated
-            for rowIndex in reversed(range(self.bomTable.rowCount())):
-                commentData = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).text().split(' ')
-                footprintData = self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_FOOT).text().split('_')
-                
-                sqlCommand = "SELECT * FROM jlc WHERE "
-                
-                if not self.useExtendedinBomCheckBox.isChecked():
-                    sqlCommand += "LibraryType='Basic' AND "
-                    
-                firstCondition = True
-
-                if len(commentData) > 0:
-                    sqlCommand += "("
-                    for keyWord in commentData:
-                        if not firstCondition:
-                            sqlCommand += "AND "
-                        firstCondition = False
-                    
-                        keyWord = keyWord.lower()
-                        sqlCommand += "(LOWER(FirstCategory) LIKE '%{0}%' OR LOWER(SecondCategory) LIKE '%{0}%' OR LOWER(Description) LIKE '%{0}%' OR LOWER(MFRPart) LIKE '%{0}%') ".format(keyWord)
-                    sqlCommand += ") "
-                
-                firstCondition = True
-                if len(footprintData) > 0:
-                    sqlCommand += " AND ("
-                    for keyWord in footprintData:
-                        if not firstCondition:
-                            sqlCommand += "AND "
-                        firstCondition = False
-                    
-                        keyWord = keyWord.lower()
-                        sqlCommand += "(LOWER(FirstCategory) LIKE '%{0}%' OR LOWER(SecondCategory) LIKE '%{0}%' OR LOWER(Description) LIKE '%{0}%' OR LOWER(MFRPart) LIKE '%{0}%' OR LOWER(Package) LIKE '%{0}%') ".format(keyWord)
-
-                    sqlCommand += ") "
-                
-                #sqlCommand += "AND Stock > 0 ORDER BY WorstPrice ASC"
-                sqlCommand += "ORDER BY LibraryType ASC, CAST(Stock AS INTEGER) DESC"
-                
-                cur.execute(sqlCommand)
-                dbRows = cur.fetchall()
-                
-                if len(dbRows) > 0:
-                    bestGuessRow = dbRows[0]
-                    #self.removeCellWidget(row, BomColumnEnum.BOM_COL_PART) 
-                    self.bomTable.setCellWidget(rowIndex, BomColumnEnum.BOM_COL_PART, PartAndDatasheetWidget(bestGuessRow[DbRowEnum.DB_ROW_LCSC_PART],'')) 
-                    #self.setItem(row, BomColumnEnum.BOM_COL_PART,    LcscLinkLabel(bestGuessRow[DbRowEnum.DB_ROW_LCSC_PART]))
-                    
-                    if bestGuessRow[DbRowEnum.DB_ROW_LIB_TYPE] == 'Basic':
-                        typeMarker = 'Y'
-                    else:
-                        typeMarker = 'N'
-                    self.bomTable.setItem(rowIndex, BomColumnEnum.BOM_COL_BASIC,   QTableWidgetItem(typeMarker))
-                    
-                    pricePer = round(bestGuessRow[DbRowEnum.DB_ROW_WORST_PRICE]/bestGuessRow[DbRowEnum.DB_ROW_MIN_QUANTITY],4)
-                    self.bomTable.setItem(rowIndex, BomColumnEnum.BOM_COL_PRICE,   QTableWidgetItem(str(pricePer)))
-                    self.bomTable.setItem(rowIndex, BomColumnEnum.BOM_COL_STOCK,   QTableWidgetItem(str(bestGuessRow[DbRowEnum.DB_ROW_STOCK])))
+    def bomShowMatch(self, rowIndex, bestGuessRow):
+        if self.bomMatchWorker.cancelled.is_set():
+            return
+        if bestGuessRow is not None:
+            #self.removeCellWidget(row, BomColumnEnum.BOM_COL_PART) 
+            self.bomTable.setCellWidget(rowIndex, BomColumnEnum.BOM_COL_PART, PartAndDatasheetWidget(bestGuessRow[DbRowEnum.DB_ROW_LCSC_PART],'')) 
+            #self.setItem(row, BomColumnEnum.BOM_COL_PART,    LcscLinkLabel(bestGuessRow[DbRowEnum.DB_ROW_LCSC_PART]))
+            
+            self.bomShowPartData(rowIndex, bestGuessRow)
+            self.bomShowImage(rowIndex, bestGuessRow[DbRowEnum.DB_ROW_LCSC_PART])
+            
+            # Green means part found
+            self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).setBackground(QColor("lightgreen"))
+        else:
+            # Pink means part not found at JLC
+            self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).setBackground(QColor("lightpink"))
 
-                    imageFilename = bestGuessRow[BomColumnEnum.BOM_COL_PART] + '.jpg'
-    
-                    if imageFilename not in self.currentImageList:
-                        imageFilename = defaultImage
-                                        
-                    imgLabel = ImgLabel(imageCacheDir + imageFilename)
-                    imgLabel.setScaledContents(True)
-                    
-                    if imageFilename != defaultImage:
-                        tooltip = '<img src="'+ imageCacheDir + imageFilename + '" width="300" height="300">'
-                        imgLabel.setToolTip(tooltip)
-    
-                    self.bomTable.setCellWidget(rowIndex, BomColumnEnum.BOM_COL_IMAGE, imgLabel)
-                    
-                    # Green means part found
-                    self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).setBackground(QColor("lightgreen"))
-                else:
-                    # Pink means part not found at JLC
-                    self.bomTable.item(rowIndex, BomColumnEnum.BOM_COL_COMMENT).setBackground(QColor("lightpink"))
-                QApplication.processEvents()
+    def bomMatchFinished(self, completed):
+        self.bomMatching = False
         self.bomSearchForParts.setText("Search For Parts")
+        self.bomSearchForParts.setEnabled(True)
 
         
     def convertProcedure(self):
-        # Abort Mechanism not working, needs a thread
         if self.converting == True:
-            self.converting = False
-            self.convertNow.setText("Convert To Database")
+            # The worker checks for this between rows
+            self.convertWorker.cancel()
+            self.convertNow.setText("Aborting...")
+            self.convertNow.setEnabled(False)
         else:
+            if not os.path.isfile(self.csvFile.currentText()):
+                self.convertStatus.setText("Can't find CSV file: {0}".format(self.csvFile.currentText()))
+                return
             self.converting = True
             self.convertNow.setText("Abort")
+            self.progressBar.setValue(0)
             
             self.convertStatus.setText("Converting {0}".format(self.csvFile.currentText()))
             
-            try:
-                os.remove(self.dbFileName.text())
-            except:
-                pass
-            
-            con = sqlite3.connect(self.dbFileName.text())
-            cur = con.cursor()
-            
-            # Create table
-            cur.execute('''CREATE TABLE jlc
-                           (LCSCPart, FirstCategory, SecondCategory, MFRPart, Package, SolderJoint, Manufacturer, LibraryType, Description, Datasheet, Price, Stock, worstPrice, minQuantity, image)''')
-            
-            # This is naff, csv.reader has no method for getting the number of records so you have to parse twice!!
-            with open(self.csvFile.currentText(), encoding='ISO8859') as csvFile:
-                row_count = sum(1 for line in csvFile)
-                
-                self.dbLength = row_count
-                
-            with open(self.csvFile.currentText(), encoding='ISO8859', newline='') as csvFile:
-                reader = csv.reader(csvFile,delimiter=',')            
-    
-                rowIndex = 0;
-                self.progressBar.setValue(0)                
-                self.converting = True
-    
-                for row in reader:
-                    # Abort mechanism
-                    if not self.converting == False:
-                        imageFilename = ''
-                        
-                        # The first line in JLC files is a header
-                        if len(row) == 13:
-                            if self.cacheAllImages.isChecked():
-                                imageFilename = row[DbRowEnum.DB_ROW_LCSC_PART] + '.jpg'
-                                if imageFilename not in self.currentImageList and imageFilename not in self.failedPartsList:
-                                    imageFilename = getimageFilename(row, self.failedPartsList)
-                                else:
-                                    imageFilename = defaultImage
-                                
-                            prices = row[DbRowEnum.DB_ROW_PRICE].split(',')
-                            worstPrice = 0.0
-                            thisPrice = 0.0
-                            minQuantity = 99999999
-                            for price in prices:
-                                # Boil down lists of prices to be just the highest price (usually lowest number)
-                                priceFor = price.split(':')
-                                
-                                if len(priceFor) > 1:
-                                    pricePart = priceFor[1]
-                                    thisQuantity = int(priceFor[0].split('-')[0])
-                                else:
-                                    # Not a range of prices
-                                    pricePart = price
-                                    thisQuantity = 1
-                
-                                try:
-                                    thisPrice = float(priceFor[1])
-                                except:
-                                    # Sometimes the price is nonsense or omitted
-                                    thisPrice = 99999999
-                                
-                                # Record the price for the minimum quantity
-                                if thisPrice > worstPrice:
-                                    worstPrice = thisPrice
-                                    
-                                if thisQuantity <= 1:
-                                    minQuantity = 1
-                                elif thisQuantity < minQuantity:
-                                    minQuantity = thisQuantity
-                            
-                            row[DbRowEnum.DB_ROW_WORST_PRICE] = worstPrice * minQuantity
-                            row[DbRowEnum.DB_ROW_FIRST_CAT] = self.fixUpOddChars(row[DbRowEnum.DB_ROW_FIRST_CAT])
-                            row[DbRowEnum.DB_ROW_SEC_CAT] = self.fixUpOddChars(row[DbRowEnum.DB_ROW_SEC_CAT])
-                            row[DbRowEnum.DB_ROW_DESCR] = self.fixUpOddChars(row[DbRowEnum.DB_ROW_DESCR])
-                            
-                            row.append(minQuantity)
-                            row.append(imageFilename)
-                            cur.execute("INSERT INTO jlc VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", row)
-                            
-                            rowIndex += 1
-    
-                            self.progressBar.setValue(1 + int((rowIndex*10000)/row_count))
-                            
-                            if self.allowCachingDuringScan:
-                                self.cachingStats.setText("Cached {0} of {1} images: {2}%".format(numFetchedImages, self.dbLength, round(100*numFetchedImages/(1+self.dbLength), 0)))
-                                
-                            QApplication.processEvents()
-                            
-            self.converting = False
-            self.convertNow.setText("Convert To Database")
-            self.convertStatus.setText("Done")
-                        
-            # Save changes
-            con.commit()
-            con.close()
+            if self.clearFailedImages.isChecked():
+                self.imageCache.clearFailed()
+            if self.allowCachingDuringScan:
+                jlccore.numFetchedImages = self.imageCache.count()
+
+            self.convertThread = QThread()
+            self.convertWorker = ConvertWorker(self.csvFile.currentText(), self.dbFileName.text(),
+                                               self.cacheAllImages.isChecked(), self.imageCache,
+                                               self.updateExisting.isChecked(), self.imageConcurrency.value())
+            self.convertWorker.moveToThread(self.convertThread)
+            self.convertThread.started.connect(self.convertWorker.run)
+            self.convertWorker.progress.connect(self.convertProgress)
+            self.convertWorker.status.connect(self.convertStatus.setText)
+            self.convertWorker.finished.connect(self.convertFinished)
+            # Direct so the thread still stops when closeEvent has the GUI thread waiting for it
+            self.convertWorker.finished.connect(self.convertThread.quit, Qt.DirectConnection)
+            self.convertThread.start()
+
+    def convertProgress(self, rowIndex, dbLength, progress):
+        self.dbLength = dbLength
+        self.progressBar.setValue(progress)
+        
+        if self.allowCachingDuringScan:
+            numFetchedImages = jlccore.numFetchedImages
+            self.cachingStats.setText("Cached {0} of {1} images: {2}%".format(numFetchedImages, self.dbLength, round(100*numFetchedImages/(1+self.dbLength), 0)))
+
+    def convertFinished(self, completed):
+        self.converting = False
+        self.partSearcher.searchCache.clear()
+        self.convertNow.setText("Convert To Database")
+        self.convertNow.setEnabled(True)
+        if completed:
+            self.progressBar.setValue(10000)
+        elif self.convertWorker.converter.cancelled.is_set():
+            # Otherwise the converter has already said what went wrong
+            self.convertStatus.setText("Aborted")
+
+    def closeEvent(self, event):
+        # Don't pull the rug out from under a conversion that's still running
+        if self.converting:
+            self.convertWorker.cancel()
+            self.convertThread.wait()
+        if self.bomMatching:
+            self.bomMatchWorker.cancel()
+            self.bomMatchThread.wait()
+        super().closeEvent(event)
     
     def openLink(self, linkStr):
         QDesktopServices.openUrl(QUrl(linkStr.replace('%3d','=')))
         
+    def liveSearch(self):
+        # Quietly does nothing until there's a usable database and enough typed to be worth searching for
+        dbFilename = self.dbFileName.text()
+        if len(self.keywords.text().strip()) >= ftsMinKeywordLength and databaseProblem(dbFilename) is None:
+            self.handleDb()
+
     def handleDb(self):        
-        if not os.path.isfile(self.dbFileName.text()):
-            error_dialog = QErrorMessage()
-            error_dialog.showMessage('Can\'t find database file: {0}'.format(self.dbFileName.text()))
-            error_dialog.exec_()
-        else:
-            self.con = sqlite3.connect(self.dbFileName.text())
-    
-            cur = self.con.cursor()
-    
-            sqlCommand = "SELECT * FROM jlc WHERE "
-            if not self.useExtendedCheckBox.isChecked():
-                sqlCommand += "LibraryType='Basic' AND "
-            
-            firstCondition = True
+        self.liveSearchTimer.stop()
+        if self.databaseUsable():
             keyWordList = self.keywords.text().split()
-    
             if len(keyWordList) > 0:
-                firstKeyword = keyWordList[0].upper()
-                if len(keyWordList) == 1 and firstKeyword[0] == 'C' and firstKeyword[1:].isnumeric():
-                    sqlCommand += "(LCSCPart = '{0}')".format(firstKeyword)
-                else:
-                    sqlCommand += "("
-                    for keyWord in keyWordList:
-                        if not firstCondition:
-                            sqlCommand += "AND "
-                        firstCondition = False
-                        
-                        keyWord = keyWord.lower()
-                        sqlCommand += "(LOWER(FirstCategory) LIKE '%{0}%' OR LOWER(SecondCategory) LIKE '%{0}%' OR LOWER(Description) LIKE '%{0}%' OR LOWER(MFRPart) LIKE '%{0}%') ".format(keyWord)
-                    sqlCommand += ") "
-                
-                packagesList = self.packages.text().split()
-                firstCondition = True
-                if len(packagesList) > 0:
-                    sqlCommand += "AND ("
-                    for package in packagesList:
-                        if not firstCondition:
-                            sqlCommand += "OR "
-                        firstCondition = False
-        
-                        sqlCommand += "LOWER(Package) LIKE LOWER('%{0}%') ".format(package)
-                    sqlCommand += ") "
-    
-                if self.sortValue == SortEnum.SORT_STOCK_DOWN:
-                    sqlCommand += "AND Stock > 0 ORDER BY LibraryType ASC, CAST(Stock AS INTEGER) DESC"
-                elif self.sortValue == SortEnum.SORT_PRICE_UP:
-                    sqlCommand += "ORDER BY LibraryType ASC, WorstPrice ASC"
-                elif self.sortValue == SortEnum.SORT_IN_STOCK_PRICE_UP:
-                    sqlCommand += "AND Stock > 0 ORDER BY LibraryType ASC, WorstPrice ASC"
-        
-                #print(sqlCommand)
-                            
-                cur.execute(sqlCommand)
-    
-                rows = cur.fetchall()
+                self.partSearcher.dbFilename = self.dbFileName.text()
+                pager = self.partSearcher.search(keyWordList, self.packages.text().split(), self.useExtendedCheckBox.isChecked(),
+                                                 self.sortValue, self.quantity.value())
                 self.update.setText("Searching")
                 QApplication.processEvents() 
-                self.partTable.searchPopulate(rows, self.loadImages.isChecked())
+                startTime = time.perf_counter()
+                self.partTable.searchPopulate(pager, self.loadImages.isChecked())
+                phaseTimings.record('table.populate', time.perf_counter() - startTime)
+                self.searchStatus.setText("{0} parts found".format(pager.count()))
                 self.update.setText("Update")
-    
+
     def sortType_clicked(self):
         if self.sortValue == SortEnum.SORT_STOCK_DOWN:
             self.sortType.setText("Sort Price Up")
@@ -959,7 +1125,11 @@ class JlcSearch(QDialog):
 
 
 if __name__ == '__main__':
-    import sys
+    import multiprocessing
+
+    # Conversion processes are started by running this again, which a frozen executable needs help with
+    multiprocessing.freeze_support()
+
     app = QApplication(sys.argv)
         
     if len(sys.argv) > 1:
@@ -0,0 +1,136 @@
+'''
+ Tests ImageFetcher against a stand-in for the LCSC image server on 127.0.0.1, so nothing goes
+ near the real one. Run with python -m unittest test_imagefetcher (or pytest)
+'''
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from jlccore import *
+
+
+class ImageServer(BaseHTTPRequestHandler):
+    # Status code for each path, anything else is a 404. Every path asked for goes in requested
+    responses = {}
+    requested = []
+    requestedLock = threading.Lock()
+
+    def do_GET(self):
+        with self.requestedLock:
+            self.requested.append(self.path)
+        status = self.responses.get(self.path, 404)
+        body = b'not really a jpeg' if status == 200 else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def imagePath(templateIndex, name):
+    return imageUrlTemplates[templateIndex].format(base='', name=name)
+
+def requestsFor(name):
+    # Probes that lost the race can still arrive after fetch() returns, so only look at this image's
+    with ImageServer.requestedLock:
+        return [path for path in ImageServer.requested if '_{0}_'.format(name) in path]
+
+def partRow(lcscPart, name):
+    # Just enough of a jlc row for imageUrlName() to find the image name in the datasheet link
+    row = [''] * len(DbRowEnum)
+    row[DbRowEnum.DB_ROW_LCSC_PART] = lcscPart
+    row[DbRowEnum.DB_ROW_DATASHEET] = 'https://datasheet.lcsc.com/lcsc/1811061923_{0}.pdf'.format(name)
+    return row
+
+
+class ImageFetcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageServer)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.urlBase = 'http://127.0.0.1:{0}'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ImageServer.responses = {}
+        ImageServer.requested = []
+        self.cacheDir = tempfile.mkdtemp() + '/'
+        self.imageCache = ImageCache(self.cacheDir, self.cacheDir + 'index.db', self.cacheDir + 'failedParts.txt')
+        self.fetcher = ImageFetcher(4, self.urlBase, self.imageCache)
+
+    def tearDown(self):
+        if self.imageCache.con is not None:
+            self.imageCache.con.close()
+        shutil.rmtree(self.cacheDir)
+
+    def testHit(self):
+        ImageServer.responses[imagePath(3, 'Hit')] = 200
+        self.assertEqual(self.fetcher.fetch(partRow('C1', 'Hit')), 'C1.jpg')
+        self.assertEqual(self.imageCache.status('C1'), imageCached)
+        with open(self.cacheDir + 'C1.jpg', 'rb') as imageFile:
+            self.assertEqual(imageFile.read(), b'not really a jpeg')
+        self.assertIn(imagePath(3, 'Hit'), requestsFor('Hit'))
+        self.assertEqual(self.imageCache.templateHits[3], 1)
+
+    def testMissing(self):
+        startTime = time.time()
+        self.assertEqual(self.fetcher.fetch(partRow('C2', 'Missing')), defaultImage)
+        self.assertEqual(self.imageCache.status('C2'), imageFailed)
+        self.assertGreaterEqual(self.imageCache.retryTimes['C2'], startTime + imageMissingExpiry)
+
+    def testErrorRetriesSooner(self):
+        for templateIndex in range(len(imageUrlTemplates)):
+            ImageServer.responses[imagePath(templateIndex, 'Broken')] = 500
+        startTime = time.time()
+        self.assertEqual(self.fetcher.fetch(partRow('C3', 'Broken')), defaultImage)
+        self.assertEqual(self.imageCache.status('C3'), imageFailed)
+        retryAfter = self.imageCache.retryTimes['C3']
+        self.assertGreaterEqual(retryAfter, startTime + imageErrorRetry)
+        self.assertLess(retryAfter, startTime + imageMissingExpiry)
+
+        # Failing again backs off further, and a missing image is still left alone for longer
+        self.fetcher.fetch(partRow('C3', 'Broken'))
+        self.assertGreater(self.imageCache.retryTimes['C3'], retryAfter)
+        self.fetcher.fetch(partRow('C4', 'Missing'))
+        self.assertGreater(self.imageCache.retryTimes['C4'], self.imageCache.retryTimes['C3'])
+
+    def testTemplateWaves(self):
+        ImageServer.responses[imagePath(5, 'First')] = 200
+        ImageServer.responses[imagePath(5, 'Second')] = 200
+        self.fetcher.fetch(partRow('C5', 'First'))
+        self.assertEqual(self.imageCache.templateWaves(), [[5], [templateIndex for templateIndex in range(len(imageUrlTemplates))
+                                                                  if templateIndex != 5]])
+
+        # The template that has found every image so far is tried on its own, and finds it
+        self.assertEqual(self.fetcher.fetch(partRow('C6', 'Second')), 'C6.jpg')
+        self.assertEqual(requestsFor('Second'), [imagePath(5, 'Second')])
+
+        # Only once it misses are the rest tried
+        ImageServer.responses[imagePath(0, 'Third')] = 200
+        self.assertEqual(self.fetcher.fetch(partRow('C7', 'Third')), 'C7.jpg')
+        self.assertEqual(requestsFor('Third')[0], imagePath(5, 'Third'))
+        self.assertIn(imagePath(0, 'Third'), requestsFor('Third')[1:])
+
+    def testFetchMany(self):
+        rows = [partRow('C{0}'.format(partIndex), 'Part{0}'.format(partIndex)) for partIndex in range(10, 30)]
+        for partIndex in range(10, 30, 2):
+            ImageServer.responses[imagePath(1, 'Part{0}'.format(partIndex))] = 200
+        results = dict((row[DbRowEnum.DB_ROW_LCSC_PART], imageFilename) for row, imageFilename in self.fetcher.fetchMany(rows))
+        self.assertEqual(len(results), 20)
+        for partIndex in range(10, 30):
+            lcscPart = 'C{0}'.format(partIndex)
+            self.assertEqual(results[lcscPart], lcscPart + '.jpg' if partIndex % 2 == 0 else defaultImage)
+            self.assertEqual(self.imageCache.status(lcscPart), imageCached if partIndex % 2 == 0 else imageFailed)
+
+
+if __name__ == '__main__':
+    unittest.main()